@@ -0,0 +1,345 @@
+# Benchmarks for enovel-project.py: the word counter against str.split(),
+# the manuscript pipeline on a generated project (pandoc and ebook-convert
+# stubbed out) and the script's startup imports.
+#
+#     python3 benchmarks/benchmark.py [--scenes N --words N] [--results FILE] [--compare FILE]
+import datetime
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from glob import glob
+
+import yaml
+
+from converter_stubs import write_converter_stubs
+
+script_file = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "enovel-project.py" )
+startup_import_budget_ms = 150
+
+def load_script():
+    # The script as a module. It reads (and creates) ./config.yml when it's
+    # imported, so that happens in a scratch directory.
+    import tempfile
+    saved_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        os.chdir( scratch_directory )
+        try:
+            spec = importlib.util.spec_from_file_location( "enovel_project", script_file )
+            module = importlib.util.module_from_spec( spec )
+            sys.modules["enovel_project"] = module
+            spec.loader.exec_module( module )
+        finally:
+            os.chdir( saved_directory )
+    return module
+
+enovel = load_script()
+
+def _reset_peak_resident_memory():
+    # Linux lets a process reset its peak RSS, elsewhere the peak covers
+    # the whole run
+    try:
+        with open( "/proc/self/clear_refs", 'w') as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+def _peak_resident_memory():
+    # peak resident set size in bytes
+    try:
+        with open( "/proc/self/status", 'r') as process_status:
+            for line in process_status:
+                if line.startswith("VmHWM:"):
+                    return int( line.split()[1] ) * 1024
+    except OSError:
+        pass
+    import resource
+    peak_rss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+def _measure( function, setup = None ):
+    # (result, seconds, peak bytes allocated, peak RSS bytes) - timed
+    # without tracemalloc running, since tracing slows everything down.
+    # setup() puts things back in the same state before each run for
+    # functions with side effects. The RSS includes the interpreter and
+    # whatever the allocator kept from earlier, the allocated peak is the
+    # function's own.
+    import tracemalloc
+    if setup is not None:
+        setup()
+    _reset_peak_resident_memory()
+    started = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - started
+    peak_resident = _peak_resident_memory()
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak_bytes, peak_resident
+
+def _print_measurement( label, seconds, peak_bytes, peak_resident ):
+    print( "    " + label.ljust(34) + ( "%.3f" % seconds ).rjust(8) + "s" + ( "%.1f" % ( peak_bytes / 1048576 ) ).rjust(10) + " MB peak" + ( "%.1f" % ( peak_resident / 1048576 ) ).rjust(9) + " MB RSS" )
+
+def synthetic_paragraphs( total_words, seed = None ):
+    # Random prose paragraphs of 20 to 120 words, the same for the same seed
+    import random
+    word_chooser = random.Random( total_words if seed is None else seed )
+    vocabulary = "the of and a to in is you that it he was for on are as with his they at be this have from or one had by word but not what all were when we there can an your which their said if do will each about how up out them then she many some so these would other into has more her two like him see time could no make than first been its who now people my made over did down only way find use may water long little very after words called just where most know".split()
+    paragraphs = []
+    written_words = 0
+    while written_words < total_words:
+        paragraph_words = [ word_chooser.choice( vocabulary ) for word in range( word_chooser.randint( 20, 120 ) ) ]
+        paragraph_words[0] = paragraph_words[0].capitalize() + "\u00a0\u2014"
+        paragraphs.append( " ".join( paragraph_words ) + "." )
+        written_words += len( paragraph_words )
+    return paragraphs
+
+def benchmark_word_count( total_words = 1000000 ):
+    import tempfile
+
+    text = "\n\n".join( synthetic_paragraphs( total_words ) )
+
+    print("* Word counting " + str( len( text.split() ) ) + " words (" + "%.1f" % ( len( text ) / 1048576 ) + "M characters)")
+    split_count, *split_measurement = _measure( lambda: len( text.split() ) )
+    _print_measurement( "len( text.split() )", *split_measurement )
+    window_count, *window_measurement = _measure( lambda: enovel.count_words( text ) )
+    _print_measurement( "count_words( text )", *window_measurement )
+
+    with tempfile.NamedTemporaryFile( suffix=".md", delete=False ) as text_file:
+        text_file.write( str.encode( text ) )
+    del text
+    try:
+        def read_and_split():
+            with open( text_file.name, 'r', encoding="utf8") as content_file:
+                return len( content_file.read().split() )
+        read_count, *read_measurement = _measure( read_and_split )
+        _print_measurement( "len( file.read().split() )", *read_measurement )
+        mmap_count, *mmap_measurement = _measure( lambda: enovel.count_file_words( text_file.name ) )
+        _print_measurement( "count_file_words( file ) (mmap)", *mmap_measurement )
+    finally:
+        os.remove( text_file.name )
+
+    if split_count == window_count == read_count == mmap_count:
+        print("* All counts match")
+    else:
+        print("ERROR: Word counts differ", split_count, window_count, read_count, mmap_count)
+
+def generate_benchmark_project( project_root, scene_total, total_words ):
+    # Writes a project in the new_chapter() layout, ten scenes to a chapter,
+    # with the usual typographic replacements configured (and used in every
+    # fourth scene)
+    paragraphs = synthetic_paragraphs( total_words )
+    scenes_per_chapter = 10
+    paragraphs_per_scene = max( 1, len( paragraphs ) // scene_total )
+    for scene_number in range( scene_total ):
+        chapter_number = scene_number // scenes_per_chapter + 1
+        chapter_directory = os.path.join( project_root, "Manuscript", "Chapter " + str( chapter_number ) + " - Benchmark Chapter" )
+        if scene_number % scenes_per_chapter == 0:
+            os.makedirs( chapter_directory )
+            with open( os.path.join( chapter_directory, "00 - Chapter Header.md" ), 'w', encoding="utf8") as header_file:
+                header_file.write( "\\newpage\n\n# Chapter " + str( chapter_number ) + " - Benchmark Chapter\n\n" )
+            with open( os.path.join( chapter_directory, "_Chapter notes.txt" ), 'w', encoding="utf8") as notes_file:
+                notes_file.write( "Place your chapter notes here!\n" )
+        if scene_number == scene_total - 1:
+            scene_paragraphs = paragraphs[ scene_number * paragraphs_per_scene: ]
+        else:
+            scene_paragraphs = paragraphs[ scene_number * paragraphs_per_scene:( scene_number + 1 ) * paragraphs_per_scene ]
+        scene_text = "\n\n".join( scene_paragraphs ) + "\n"
+        if scene_number % 4 == 3:
+            # every fourth scene uses the replacements and ends in an HR
+            scene_text = scene_text.replace( "\u00a0\u2014", " -- ", 3 ).replace( ".", "...", 2 ) + "\n---\n"
+        with open( os.path.join( chapter_directory, "%02d - Scene.md" % ( scene_number % scenes_per_chapter + 1 ) ), 'w', encoding="utf8") as scene_file:
+            scene_file.write( scene_text )
+
+    benchmark_config = dict( enovel.config )
+    benchmark_config.update( bookName = "Benchmark", bookFile = "Benchmark", coverImage = "", replacements = { "--": "\u2014", "...": "\u2026" } )
+    with open( os.path.join( project_root, "config.yml" ), 'w', encoding="utf8") as config_file:
+        yaml.dump( benchmark_config, config_file, default_flow_style=False )
+    return benchmark_config
+
+def benchmark_project( scene_total = 500, total_words = 250000 ):
+    # Times the manuscript pipeline on a generated project, pandoc and
+    # ebook-convert stubbed out. Returns {label: {"seconds", "peak_bytes",
+    # "peak_rss"}}.
+    import tempfile
+
+    saved_path = os.environ.get("PATH", "")
+    saved_directory = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as benchmark_root:
+        project_root = os.path.join( benchmark_root, "project" )
+        print("* Generating a " + str( scene_total ) + " scene, " + str( total_words ) + " word project")
+        generate_benchmark_project( project_root, scene_total, total_words )
+        write_converter_stubs( os.path.join( benchmark_root, "bin" ) )
+        os.environ["PATH"] = os.path.join( benchmark_root, "bin" ) + os.pathsep + saved_path
+        os.chdir( project_root )
+        try:
+            enovel.load_config()
+            enovel.reset_project_state()
+            enovel.compile_normalizer()
+            enovel.command_options["force"] = False
+            enovel.command_options["incremental"] = False
+
+            def forget_index():
+                enovel.current_project_index = None
+            def remove_index():
+                forget_index()
+                if os.path.isfile( enovel.project_index_file ):
+                    os.remove( enovel.project_index_file )
+            def remove_progress():
+                for progress_file in glob( enovel.progress_directory + "/progress*" ):
+                    os.remove( progress_file )
+            def remove_exports():
+                enovel.recreate_epub_and_temp_files = True
+                for export_path in glob( enovel.export_directory + "/*" ) + glob( enovel.export_directory + "/.*" ):
+                    if os.path.isdir( export_path ):
+                        for cached_file in glob( export_path + "/*" ):
+                            os.remove( cached_file )
+                    else:
+                        os.remove( export_path )
+            def rebuild_allowed():
+                enovel.recreate_epub_and_temp_files = True
+            def edit_one_chapter():
+                with open( "Manuscript/Chapter 1 - Benchmark Chapter/01 - Scene.md", 'a', encoding="utf8") as scene_file:
+                    scene_file.write( "\nOne more line.\n" )
+                enovel.project_index( refresh = True )
+
+            scene_texts = []
+            for file_path in enovel.project_index().scene_files():
+                with open( file_path, 'r', encoding="utf8") as scene_file:
+                    scene_texts.append( scene_file.read() )
+
+            quiet = lambda function: ( lambda: _run_quietly( function ) )
+            def write_manuscript_to_null():
+                with open( os.devnull, 'w', encoding="utf8") as null_file:
+                    enovel.write_manuscript( null_file )
+
+            # ( label, function, setup, low memory mode )
+            phases = [
+                ( "project scan (no index)", enovel.project_index, remove_index, False ),
+                ( "project scan (no index, low mem)", enovel.project_index, remove_index, True ),
+                ( "project scan (indexed)", enovel.project_index, forget_index, False ),
+                ( "write_manuscript()", write_manuscript_to_null, None, False ),
+                ( "write_manuscript() (low mem)", write_manuscript_to_null, None, True ),
+                ( "normalize_markdown() every scene", lambda: [ enovel.normalize_markdown( scene_text ) for scene_text in scene_texts ], None, False ),
+                ( "word_count() (no index)", quiet( enovel.word_count ), remove_index, False ),
+                ( "word_count() (indexed)", quiet( enovel.word_count ), forget_index, False ),
+                ( "stats (indexed)", quiet( enovel.stats ), forget_index, False ),
+                ( "save_progress() (first save)", quiet( enovel.save_progress ), remove_progress, False ),
+                ( "save_progress() (unchanged)", quiet( enovel.save_progress ), lambda: None, False ),
+                ( "build_exports( all ) (clean)", quiet( lambda: enovel.build_exports( enovel.all_export_targets ) ), remove_exports, False ),
+                ( "build_exports( all ) (up to date)", quiet( lambda: enovel.build_exports( enovel.all_export_targets ) ), rebuild_allowed, False ),
+                ( "incremental epub (clean)", quiet( enovel.create_incremental_epub ), remove_exports, False ),
+                ( "incremental epub (1 chapter edit)", quiet( enovel.create_incremental_epub ), edit_one_chapter, False ),
+            ]
+            print( "    " + "".ljust(34) + "time".rjust(9) + "allocated".rjust(18) + "peak RSS".rjust(16) )
+            for label, function, setup, low_memory in phases:
+                enovel.config["lowMemory"] = low_memory
+                measured, seconds, peak_bytes, peak_resident = _measure( function, setup )
+                _print_measurement( label, seconds, peak_bytes, peak_resident )
+                results[ label ] = dict( seconds = seconds, peak_bytes = peak_bytes, peak_rss = peak_resident )
+        finally:
+            enovel.remove_temp_files()
+            os.chdir( saved_directory )
+            os.environ["PATH"] = saved_path
+    return results
+
+def _run_quietly( function ):
+    import contextlib
+    with contextlib.redirect_stdout( io.StringIO() ):
+        return function()
+
+def write_benchmark_results( results_file, scene_total, total_words, results ):
+    import platform
+    with open( results_file, 'w', encoding="utf8") as json_file:
+        json.dump( dict(
+            version = enovel.__version__,
+            python = platform.python_version(),
+            recorded = datetime.datetime.now().isoformat(),
+            scenes = scene_total,
+            words = total_words,
+            results = results,
+        ), json_file, indent=1, sort_keys=True )
+    print("* Wrote benchmark results to " + results_file)
+
+def compare_benchmark_results( results_file, results ):
+    # Prints each timing next to the one recorded in an earlier results file
+    with open( results_file, 'r', encoding="utf8") as json_file:
+        baseline = json.load( json_file )
+    print("* Compared with " + results_file + " (version " + str( baseline.get("version") ) + ", " + str( baseline.get("scenes") ) + " scenes, " + str( baseline.get("words") ) + " words)")
+    for label, measurement in results.items():
+        if label not in baseline.get( "results", {} ):
+            continue
+        baseline_seconds = baseline["results"][ label ]["seconds"]
+        change = ""
+        if baseline_seconds > 0:
+            change = ( "%+.0f%%" % ( ( measurement["seconds"] - baseline_seconds ) / baseline_seconds * 100 ) ).rjust(10)
+        print( "    " + label.ljust(34) + ( "%.3f" % baseline_seconds ).rjust(8) + "s ->" + ( "%.3f" % measurement["seconds"] ).rjust(8) + "s" + change )
+
+def _import_times( python_args, project_root ):
+    # {top level module: cumulative microseconds} from python -X importtime
+    import_run = subprocess.run( [ sys.executable, "-X", "importtime" ] + python_args, cwd=project_root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True )
+    import_times = {}
+    for line in import_run.stderr.splitlines():
+        if line.startswith("import time:") == False or "cumulative" in line:
+            continue
+        self_time, cumulative_time, module_name = line[ len("import time:"): ].split("|")
+        # nested imports are indented past the single leading space
+        if module_name.startswith("  ") == False:
+            import_times[ module_name.strip() ] = int( cumulative_time )
+    return import_times
+
+def benchmark_startup():
+    # Guards the lazy imports: starting the script (no command) must not
+    # import any of the heavy optional dependencies, and its own imports
+    # have to stay inside startup_import_budget_ms
+    import tempfile
+    with tempfile.TemporaryDirectory() as project_root:
+        interpreter_imports = _import_times( [ "-c", "pass" ], project_root )
+        started = time.perf_counter()
+        script_imports = _import_times( [ script_file ], project_root )
+        startup_seconds = time.perf_counter() - started
+
+    script_imports = dict( ( module_name, microseconds ) for module_name, microseconds in script_imports.items() if module_name not in interpreter_imports )
+    import_milliseconds = sum( script_imports.values() ) / 1000
+    print("* Startup " + "%.3f" % startup_seconds + "s wall clock, " + "%.1f" % import_milliseconds + "ms of module imports (budget " + str( startup_import_budget_ms ) + "ms)")
+    for module_name in sorted( script_imports, key=script_imports.get, reverse=True )[:5]:
+        print( "    " + module_name.ljust(34) + ( "%.1f" % ( script_imports[ module_name ] / 1000 ) ).rjust(8) + "ms" )
+
+    startup_ok = True
+    for module_name in enovel.startup_guarded_modules:
+        if module_name in script_imports:
+            print("ERROR: " + module_name + " is imported at startup, import it in the command that needs it")
+            startup_ok = False
+    if import_milliseconds > startup_import_budget_ms:
+        print("ERROR: Startup imports take longer than the " + str( startup_import_budget_ms ) + "ms budget")
+        startup_ok = False
+    return startup_ok
+
+def benchmark( arguments ):
+    import argparse
+    parser = argparse.ArgumentParser( description="Times the word counter and the whole pipeline on a generated project, and checks the startup imports stay lazy" )
+    parser.add_argument( "--scenes", type=int, default=500, help="scenes in the generated project (default: 500)" )
+    parser.add_argument( "--words", type=int, default=250000, help="words in the generated project (default: 250000)" )
+    parser.add_argument( "--results", metavar="FILE", help="save the timings as JSON" )
+    parser.add_argument( "--compare", metavar="FILE", help="compare with timings saved by --results" )
+    options = parser.parse_args( arguments )
+
+    benchmark_word_count()
+    project_results = benchmark_project( max( 1, options.scenes ), max( 1, options.words ) )
+    if options.results:
+        write_benchmark_results( options.results, options.scenes, options.words, project_results )
+    if options.compare:
+        compare_benchmark_results( options.compare, project_results )
+    if benchmark_startup() == False:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    benchmark( sys.argv[1:] )
@@ -0,0 +1,31 @@
+# Stand-ins for pandoc and ebook-convert that just copy their input, so the
+# export pipeline can be timed and tested without the converters themselves
+import os
+import sys
+
+stubs = dict(
+    pandoc = "\n".join( [
+        "import sys, shutil, html",
+        "args = sys.argv[1:]",
+        "if '--version' in args:",
+        "    print( 'pandoc 2.9.2 (benchmark stub)' )",
+        "    sys.exit( 0 )",
+        "inputs = [ arg for number, arg in enumerate( args ) if not arg.startswith( '-' ) and ( number == 0 or args[ number - 1 ] not in ( '-o', '-f', '-t', '-V' ) ) ]",
+        "source = open( inputs[0], 'rb' ) if inputs else sys.stdin.buffer",
+        "if '-o' in args:",
+        "    with open( args[ args.index( '-o' ) + 1 ], 'wb' ) as output_file:",
+        "        shutil.copyfileobj( source, output_file )",
+        "else:",
+        "    sys.stdout.write( '<pre>' + html.escape( source.read().decode( 'utf8' ) ) + '</pre>' )",
+    ] ),
+    **{ "ebook-convert": "import sys, shutil\nshutil.copyfile( sys.argv[1], sys.argv[2] )" }
+)
+
+def write_converter_stubs( bin_directory ):
+    # Writes the stubs into bin_directory, put it first on the PATH to use them
+    os.makedirs( bin_directory )
+    for stub_name, stub_code in stubs.items():
+        stub_file = os.path.join( bin_directory, stub_name )
+        with open( stub_file, 'w', encoding="utf8") as script_file:
+            script_file.write( "#!" + sys.executable + "\n" + stub_code + "\n" )
+        os.chmod( stub_file, 0o755 )
@@ -9,15 +9,22 @@ Find this at: https://github.com/jdgwf/epub-novel-tools
 
 import os
 import sys
+import time
 from glob import glob
-from shutil import copyfile
+import shutil
+from shutil import which
 import yaml
-import csv
 import datetime
-import importlib
+import importlib.util
 import hashlib
-import requests
-import xmltodict
+import json
+import re
+import mmap
+import io
+import subprocess
+import threading
+# requests, xmltodict, watchdog, numpy and matplotlib take several hundred
+# milliseconds to import, so only the commands that need them import them
 
 __author__ = "Jeffrey D. Gordon"
 __copyright__ = "Copyright 2016-2017, Jeffrey D. Gordon"
@@ -34,16 +41,65 @@ _debug = False
 export_directory = "./Exports"
 manuscript_dir = "./Manuscript"
 progress_directory = "./Progress"
+project_index_file = progress_directory + "/project-index.json"
+progress_database_file = progress_directory + "/progress.sqlite"
+pandoc_version_file = progress_directory + "/pandoc-version.json"
+manuscript_ast_file = export_directory + "/.manuscript-ast.json"
+build_manifest_file = export_directory + "/.build-manifest.json"
+timing_log_file = progress_directory + "/timings.jsonl"
+nano_queue_file = progress_directory + "/nano-queue.json" # a count nanowrimo.org hasn't received yet
+nano_retry_backoff_seconds = 1.0 # doubled after every failed attempt
+epub_chapter_cache_directory = export_directory + "/.epub-chapters" # rendered chapter XHTML, keyed by content hash
+build_workspace_parents = [ "/dev/shm" ] # tmpfs, tried before the system's temp directory
+scene_separator = "\n\n----\n\n"
+word_count_window = 1 << 16 # characters (or bytes) count_words() splits at a time
+utf8_spaces = None
+utf8_rare_space_pattern = None
+utf8_continuation_bytes = bytes( range( 0x80, 0xC0 ) ) # every byte of a UTF-8 character but the first
+hr_markers = [ "----\n", "\n----", "---\n", "\n---" ] # removed from every scene
+normalizer_version = 3 # bump when normalize_markdown() output changes so cached counts are redone
+project_index_version = 2 # bump when the project index entries gain a count
+paragraph_break_pattern = re.compile( "\n[ \t]*\n[ \t\n]*" ) # a blank line (or several)
+paragraph_break_byte_pattern = re.compile( b"\n[ \t]*\n[ \t\n]*" )
+all_export_targets = [ "epub", "mobi", "html", "txt", "pdf", "md", "odt", "docx" ]
+export_dependencies = dict(
+    mobi = [ "epub" ], # ebook-convert reads the built epub
+)
+startup_guarded_modules = [ "numpy", "matplotlib", "requests", "xmltodict", "watchdog" ] # never imported at startup
+watch_debounce_seconds = 1.0 # quiet period before watch recounts after a burst of events
 
 default_pdf_font_size = "12pt" # latex only supports 10pt, 11pt, and 12pt
+export_config_keys = [ "bookName", "authorName", "copyRight", "languageCode", "publisherName", "pdfFontSize", "coverImage", "replacements" ] # the config an export is built from
+plain_text_columns = 72 # same margin as pandoc's plain text writer
 
 pandoc_markdown_arg = ""
+pandoc_version = ""
 
-# Initial Config - this will create a config.yml file to modify
 todays_progress = 0
 recreate_epub_and_temp_files = True
+current_project_index = None
+phase_timings = {} # phase: [seconds, calls], only collected with --timings or --timing-log
+phase_timings_lock = threading.Lock()
+build_results = {} # target: (exit code, seconds) of every export built in this run
+build_workspace_directory = None # this run's private directory for intermediates, see build_workspace()
+build_workspace_lock = threading.Lock()
+
+command_options = dict(
+    jobs = os.cpu_count() or 1,
+    force = False,
+    incremental = False,
+    build = [], # exports watch rebuilds after every change
+    timings = False, # print a per-phase breakdown at the end of the run
+    timing_log = False, # append it to Progress/timings.jsonl
+    profile = "", # cProfile dump file
+    run = [ "all" ], # what batch runs in each project
+    results = "", # batch summary file to write
+    output_format = "table", # stats and history, or json, csv
+    days = 14, # how far back history goes
+)
 
-config = dict(
+# Initial Config - load_config() will create a config.yml file to modify
+default_config = dict(
     bookName = "My Ebook",
     bookFile = "My Ebook",
     authorName = "Author Name",
@@ -51,85 +107,285 @@ config = dict(
     languageCode = "en-US",
     publisherName = "Self Published",
     pdfFontSize = default_pdf_font_size,
+    graphFormat = "png",
+    graphDPI = 300,
+    sceneReadWorkers = 1,
+    lowMemory = False,
     coverImage = "",
     nanoWriMoSecretKey = "",
     nanoWriMoUsername = "",
+    nanoWriMoTimeout = 10,
+    nanoWriMoRetries = 3,
+    nanoWriMoWatchSync = False,
+    nanoWriMoSyncInterval = 300,
     wordCountOffset = 0,
     replacements = {},
 )
 
-if os.path.isfile("config.yml") == False:
-    with open('config.yml', 'w', encoding="utf8") as outfile:
-        yaml.dump(config, outfile, default_flow_style=False)
-else:
-    config = yaml.safe_load(open("config.yml", encoding="utf8"))
+# find_spec() only locates the packages, save_progress() imports them when drawing
+found_matplotlib = importlib.util.find_spec('numpy') is not None and importlib.util.find_spec('matplotlib') is not None
 
+def load_config():
+    # Reads ./config.yml (creating it with the defaults the first time) and
+    # fills in any settings it doesn't have. Called once at startup, and
+    # again for every project in batch mode.
+    global config, nano_api_url_current_word_count, nano_api_url_current_word_count_history, nano_api_url_update_word_count
 
-# To get NanoWrioSecret go to https://nanowrimo.org/api/word_count while logged in.
-if "nanoWriMoSecretKey" not in config:
-    config["nanoWriMoSecretKey"] = ""
+    if os.path.isfile("config.yml") == False:
+        with open('config.yml', 'w', encoding="utf8") as outfile:
+            yaml.dump(default_config, outfile, default_flow_style=False)
+        config = dict( default_config )
+    else:
+        with open("config.yml", encoding="utf8") as config_file:
+            config = yaml.safe_load( config_file )
 
-if "nanoWriMoUsername" not in config:
-    config["nanoWriMoUsername"] = ""
+    # To get NanoWrioSecret go to https://nanowrimo.org/api/word_count while logged in.
+    if "nanoWriMoSecretKey" not in config:
+        config["nanoWriMoSecretKey"] = ""
 
-if "wordCountOffset" not in config:
-    config["wordCountOffset"] = 0
+    if "nanoWriMoUsername" not in config:
+        config["nanoWriMoUsername"] = ""
 
-if "pdfFontSize" not in config:
-    config["pdfFontSize"] = default_pdf_font_size
+    # seconds to wait for nanowrimo.org, and how many times to try again
+    if "nanoWriMoTimeout" not in config:
+        config["nanoWriMoTimeout"] = 10
 
-try:
-    importlib.util.find_spec('numpy')
-    importlib.util.find_spec('matplotlib')
+    if "nanoWriMoRetries" not in config:
+        config["nanoWriMoRetries"] = 3
 
-    found_matplotlib = True
-except ImportError:
-    found_matplotlib = False
+    # watch sends your count to nanowrimo.org as you write, at most once
+    # every nanoWriMoSyncInterval seconds
+    if "nanoWriMoWatchSync" not in config:
+        config["nanoWriMoWatchSync"] = False
 
-if found_matplotlib:
-    import numpy as np
-    import matplotlib.pyplot as plt
+    if "nanoWriMoSyncInterval" not in config:
+        config["nanoWriMoSyncInterval"] = 300
+
+    # blank for nanowrimo.org, set them to test against a local server
+    if "nanoWriMoUpdateUrl" not in config:
+        config["nanoWriMoUpdateUrl"] = ""
+
+    if "nanoWriMoCountUrl" not in config:
+        config["nanoWriMoCountUrl"] = ""
+
+    if "wordCountOffset" not in config:
+        config["wordCountOffset"] = 0
+
+    if "pdfFontSize" not in config:
+        config["pdfFontSize"] = default_pdf_font_size
+
+    if "replacements" not in config:
+        config["replacements"] = {}
 
-# Immutable Variables
-nano_api_url_current_word_count = "https://nanowrimo.org/wordcount_api/wc/" + config["nanoWriMoUsername"]
-nano_api_url_current_word_count_history = "https://nanowrimo.org/modules/wordcount_api/wchistory/" + config["nanoWriMoUsername"]
-nano_api_url_update_word_count = "https://nanowrimo.org/api/wordcount"
+    # png, svg or none
+    if "graphFormat" not in config:
+        config["graphFormat"] = "png"
+
+    if "graphDPI" not in config:
+        config["graphDPI"] = 300
+
+    # scene files read at once, more than 1 only pays off on network shares
+    # where every open() waits on the server (on a local disk it's slower)
+    if "sceneReadWorkers" not in config:
+        config["sceneReadWorkers"] = 1
+
+    # count and read scenes straight from their mmap'ed bytes, for very large projects
+    if "lowMemory" not in config:
+        config["lowMemory"] = False
+
+    # Immutable Variables (for this project)
+    nano_api_url_current_word_count = config["nanoWriMoCountUrl"] or "https://nanowrimo.org/wordcount_api/wc/" + config["nanoWriMoUsername"]
+    nano_api_url_current_word_count_history = "https://nanowrimo.org/modules/wordcount_api/wchistory/" + config["nanoWriMoUsername"]
+    nano_api_url_update_word_count = config["nanoWriMoUpdateUrl"] or "https://nanowrimo.org/api/wordcount"
+
+load_config()
+
+def reset_project_state():
+    # Forgets everything loaded from the current project, so batch mode can
+    # move on to the next one (after a chdir and load_config())
+    global todays_progress, recreate_epub_and_temp_files, current_project_index, pandoc_markdown_arg, pandoc_version
+    todays_progress = 0
+    recreate_epub_and_temp_files = True
+    current_project_index = None
+    pandoc_markdown_arg = ""
+    pandoc_version = ""
+    phase_timings.clear()
+    build_results.clear()
+    compile_normalizer()
 
 def _set_pandoc_args():
-    global pandoc_markdown_arg
+    global pandoc_markdown_arg, pandoc_version
 
-    if pandoc_markdown_arg == "":
+    if pandoc_version == "":
         # For pandoc 2+
         # pandoc_markdown_arg = "-f markdown+smart"
 
         # For pandoc 1.19.2.4
         # pandoc_markdown_arg = "-S"
 
-        version_return = os.popen("pandoc --version").read()
-        # print("v", version_return)
-        version_return_lines = version_return.split("\n")
-        if version_return_lines[0].find("pandoc 1.1") == 0:
+        pandoc_version = _detect_pandoc_version()
+        if pandoc_version.find("pandoc 1.1") == 0:
             pandoc_markdown_arg = "-S"
             if _debug:
-                print( "* Detected " + version_return_lines[0] + ". Setting markdown arg to '" + pandoc_markdown_arg + "'")
+                print( "* Detected " + pandoc_version + ". Setting markdown arg to '" + pandoc_markdown_arg + "'")
 
-        if version_return_lines[0].find("pandoc 2.") == 0:
+        if pandoc_version.find("pandoc 2.") == 0:
             pandoc_markdown_arg = "-f markdown+smart"
             if _debug:
-                print( "* Detected " + version_return_lines[0] + ". Setting markdown arg to ''" + pandoc_markdown_arg + "'")
+                print( "* Detected " + pandoc_version + ". Setting markdown arg to ''" + pandoc_markdown_arg + "'")
+
+def _detect_pandoc_version():
+    # The first line of `pandoc --version`, cached in Progress/ against the
+    # pandoc executable's path, size and mtime so it's only run again after
+    # pandoc is upgraded
+    pandoc_path = which("pandoc")
+    if pandoc_path is None:
+        return "unknown"
+    pandoc_stat = os.stat( pandoc_path )
+    pandoc_key = [ pandoc_path, pandoc_stat.st_mtime_ns, pandoc_stat.st_size ]
+
+    if os.path.isfile( pandoc_version_file ):
+        try:
+            with open( pandoc_version_file, 'r', encoding="utf8") as version_file:
+                cached_version = json.load( version_file )
+            if cached_version.get("pandoc") == pandoc_key:
+                return cached_version["version"]
+        except ValueError:
+            if _debug:
+                print("* Ignoring unreadable pandoc version cache " + pandoc_version_file)
+
+    started = time.perf_counter()
+    version_return = subprocess.run( [ pandoc_path, "--version" ], stdout=subprocess.PIPE, universal_newlines=True ).stdout
+    record_timing( "pandoc --version", started )
+    version = version_return.split("\n")[0] or "unknown"
+
+    if os.path.isdir( progress_directory ) == False:
+        os.mkdir( progress_directory )
+    with open( pandoc_version_file, 'w', encoding="utf8") as version_file:
+        json.dump( { "pandoc": pandoc_key, "version": version }, version_file )
+    return version
 
 
 def watch():
-    import time
     from watchdog.observers import Observer
     from watchdog.events import FileSystemEventHandler
     global current_word_count, start_word_count
 
-
     save_progress()
 
-    current_word_count = word_count()
+    # The project index is kept up to date from the events themselves so the
+    # manuscript tree is never rescanned while watching
+    scene_index = project_index()
+
+    current_word_count = scene_index.word_count() - config["wordCountOffset"]
     start_word_count = int(current_word_count)
+
+    # watch --build: exports rebuilt in the background after each recount,
+    # a new edit cancels a build that's still running. The build holds
+    # index_lock so the index isn't changed under it.
+    build_targets = command_options["build"]
+    index_lock = threading.Lock()
+    build_requested = threading.Event()
+    # guards running_build, a build's cancel event is published before its
+    # request is cleared so an edit in between always cancels it
+    build_lock = threading.Lock()
+    running_build = dict( cancel_event = None, stopping = False )
+    build_thread = None
+    saved_incremental = command_options["incremental"]
+
+    def cancel_build():
+        with build_lock:
+            if running_build["cancel_event"] is not None:
+                running_build["cancel_event"].set()
+
+    def build_worker():
+        global recreate_epub_and_temp_files
+        while True:
+            build_requested.wait()
+            with build_lock:
+                if running_build["stopping"]:
+                    return
+                cancel_event = threading.Event()
+                running_build["cancel_event"] = cancel_event
+                build_requested.clear()
+            with index_lock:
+                # a build earlier in the watch doesn't count as this one
+                recreate_epub_and_temp_files = True
+                print("* Rebuilding " + ", ".join( build_targets ) )
+                try:
+                    build_exports( build_targets, cancel_event = cancel_event )
+                except Exception as error:
+                    print("ERROR: Build failed: " + str( error ) )
+            with build_lock:
+                running_build["cancel_event"] = None
+
+    def stop_building():
+        with build_lock:
+            running_build["stopping"] = True
+        cancel_build()
+        build_requested.set()
+        if build_thread is not None:
+            build_thread.join()
+
+    if build_targets:
+        # only changed chapters are re-rendered, the rest of the build is reused
+        command_options["incremental"] = True
+        print("* Rebuilding " + ", ".join( build_targets ) + " after every change")
+        build_thread = threading.Thread( target=build_worker, name="watch-build", daemon=True )
+        build_thread.start()
+        build_requested.set()
+
+    nano_sync = None
+    if config["nanoWriMoWatchSync"]:
+        if config["nanoWriMoSecretKey"] and config["nanoWriMoUsername"]:
+            print("* Sending your word count to NaNoWriMo at most every " + str( config["nanoWriMoSyncInterval"] ) + " seconds")
+            nano_sync = NaNoSync( config["nanoWriMoSyncInterval"] )
+        else:
+            print("Warning nanoWriMoWatchSync is on but your nanoWriMoSecretKey and nanoWriMoUsername aren't set")
+
+    pending_events = []
+    pending_lock = threading.Lock()
+
+    def manuscript_path( event_path ):
+        # watchdog may report absolute paths, the index is keyed like manuscript_files()
+        relative_path = os.path.relpath( event_path, manuscript_dir )
+        if relative_path.split( os.sep )[0] == os.pardir:
+            # moved out of the manuscript
+            return ""
+        return os.path.join( manuscript_dir, relative_path )
+
+    def apply_pending_events():
+        global current_word_count
+        with pending_lock:
+            events = list( pending_events )
+            del pending_events[:]
+        if not events:
+            return
+
+        print("---------- Watch Event @ " + datetime.datetime.now().strftime("%H:%M:%S") + " ----------------")
+        # newer edits supersede a build that's still running
+        cancel_build()
+        with index_lock:
+            for event_type, is_directory, src_path, dest_path in events:
+                print("* Received " + event_type + " event - " + ( src_path or dest_path ) + ".")
+                scene_index.apply_event( event_type, is_directory, src_path, dest_path )
+
+            scene_index.save()
+            total_word_count = scene_index.word_count()
+        if build_targets:
+            build_requested.set()
+        save_progress( True, total_word_count )
+        new_word_count = total_word_count - config["wordCountOffset"]
+        print("    Project Wordcount: " + str(new_word_count) )
+        print("     Today's Progress: " + str(todays_progress ) )
+
+        print("* Words writting since start: " + str(new_word_count - start_word_count) )
+        print("* Words writting since last save: " + str(new_word_count - current_word_count) )
+        if nano_sync is not None and new_word_count != current_word_count:
+            # sent from the sync thread, this only queues it
+            nano_sync.submit( new_word_count )
+        current_word_count = new_word_count
+
     class Watcher:
         DIRECTORY_TO_WATCH = manuscript_dir
 
@@ -151,293 +407,1372 @@ def watch():
 
 
     class Handler(FileSystemEventHandler):
+        debounce_timer = None
 
-        @staticmethod
-        def on_any_event(event):
-            global current_word_count, start_word_count
-            if event.is_directory:
+        def on_any_event(self, event):
+            if event.event_type not in ('created', 'modified', 'deleted', 'moved'):
+                return None
+            # plain modified events on directories carry no count changes
+            if event.is_directory and event.event_type == 'modified':
                 return None
 
-            elif event.event_type == 'created':
-                # Take any action here when a file is first created.
-
-                print("---------- Watch Event @ " + datetime.datetime.now().strftime("%H:%M:%S") + " ----------------")
-                print("* Received created event - %s." % event.src_path)
-
-            elif event.event_type == 'modified':
-                # Taken any action here when a file is modified.
-                print("---------- Watch Event @ " + datetime.datetime.now().strftime("%H:%M:%S") + " ----------------")
-                print("* Received modified event - %s." % event.src_path)
-            new_word_count = word_count()
-            save_progress(True)
+            dest_path = getattr( event, "dest_path", "" )
+            with pending_lock:
+                pending_events.append( (
+                    event.event_type,
+                    event.is_directory,
+                    manuscript_path( event.src_path ),
+                    manuscript_path( dest_path ) if dest_path else "",
+                ) )
+
+            # editors fire several events per save, only recount once things go quiet
+            if self.debounce_timer is not None:
+                self.debounce_timer.cancel()
+            self.debounce_timer = threading.Timer( watch_debounce_seconds, apply_pending_events )
+            self.debounce_timer.daemon = True
+            self.debounce_timer.start()
 
-            print("* Words writting since start: " + str(new_word_count - start_word_count) )
-            print("* Words writting since last save: " + str(new_word_count - current_word_count) )
-            current_word_count = new_word_count
     w = Watcher()
     print("* Press Control-C to stop watching")
-    w.run()
-
-
-def apply_replacements( file_contents ):
+    try:
+        w.run()
+    finally:
+        # a build still running is cancelled and waited for, its exports
+        # are never left half published
+        stop_building()
+        command_options["incremental"] = saved_incremental
+        if nano_sync is not None:
+            nano_sync.close()
+
+
+def compile_normalizer():
+    # Collects config["replacements"] for normalize_markdown() and the
+    # substrings that tell the low memory mode a scene needs normalizing.
+    # Call again whenever config changes.
+    global normalize_replacements, normalize_byte_triggers
+
+    normalize_replacements = []
     if config["replacements"]:
         for replace_value in config["replacements"]:
-            replace_with = config["replacements"][replace_value]
-            file_contents = file_contents.replace( replace_value, replace_with )
-    return file_contents
+            # an empty key would insert its value between every character
+            if replace_value != "":
+                normalize_replacements.append( ( replace_value, config["replacements"][replace_value] ) )
 
+    # the low memory mode searches the raw bytes, where \r\n hasn't been
+    # turned into \n yet. Replacements only chain off a key that's in the
+    # text to begin with, and every HR marker contains "---".
+    normalize_byte_triggers = [ b"---", b"\r" ] + [ str.encode( replace_value ) for replace_value, replace_with in normalize_replacements ]
 
 def normalize_markdown( file_contents ):
-
-    file_contents = apply_replacements( file_contents)
+    started = time.perf_counter()
+    # apply the replacements in config order, each one sees the text the
+    # ones before it left (str.replace() hands back the same string when
+    # there's nothing to replace, so unused entries cost one search)
+    for replace_value, replace_with in normalize_replacements:
+        file_contents = file_contents.replace( replace_value, replace_with )
 
     # trim the contents
     file_contents = file_contents.strip()
+
     # remove existing markdown HRs
-    file_contents = file_contents.replace( "----\n", "")
-    file_contents = file_contents.replace( "\n----", "")
-    file_contents = file_contents.replace( "---\n", "")
-    file_contents = file_contents.replace( "\n---", "")
+    if "---" in file_contents:
+        for hr_marker in hr_markers:
+            file_contents = file_contents.replace( hr_marker, "" )
 
     # replace all triple newlines with double newlines (normalize any extras)
     file_contents = file_contents.replace( "\n\n\n", "\n\n")
 
+    record_timing( "normalize", started )
     return file_contents
 
-def updateNaNo():
-    if config["nanoWriMoSecretKey"] and config["nanoWriMoUsername"]:
-
-        manuscript_data = pre_process()
-        manuscript_data = normalize_markdown( manuscript_data )
-        theword_count = len(manuscript_data.split()) - config["wordCountOffset"]
-
-        the_hash =  str(hashlib.sha1( str.encode(config["nanoWriMoSecretKey"] + config["nanoWriMoUsername"] + str(theword_count)) ).hexdigest() )
-
+def _utf8_spaces():
+    # UTF-8 encodings of every character str.split() treats as whitespace
+    # (the last unicode whitespace character is U+3000 IDEOGRAPHIC SPACE)
+    return tuple( chr(code_point).encode("utf8") for code_point in range( 0x3001 ) if chr(code_point).isspace() )
+
+def count_words( text ):
+    # Same result as len( text.split() ), but only one window of the text is
+    # split at a time so counting a whole book never builds a list of every
+    # word in it. Accepts str, or UTF-8 bytes/mmap/memoryview.
+    started = time.perf_counter()
+    if isinstance( text, str ):
+        word_total = _count_text_words( text )
+    else:
+        word_total = _count_utf8_words( text )
+    record_timing( "count", started )
+    return word_total
+
+def _count_text_words( text ):
+    words = 0
+    previous_ends_in_word = False
+    for window_start in range( 0, len( text ), word_count_window ):
+        window = text[ window_start : window_start + word_count_window ]
+        words += len( window.split() )
+        # a word straddling the window edge was counted on both sides
+        if previous_ends_in_word and window[0].isspace() == False:
+            words -= 1
+        previous_ends_in_word = window[-1].isspace() == False
+    return words
+
+def _count_utf8_words( buffer ):
+    global utf8_spaces, utf8_rare_space_pattern
+    if utf8_spaces is None:
+        utf8_spaces = _utf8_spaces()
+        # everything bytes.split() doesn't already split on
+        utf8_rare_space_pattern = re.compile( b"|".join( re.escape( space ) for space in utf8_spaces if space not in b" \t\n\r\x0b\x0c" ) )
+
+    words = 0
+    previous_ends_in_word = False
+    window_start = 0
+    buffer_length = len( buffer )
+    while window_start < buffer_length:
+        window_end = min( window_start + word_count_window, buffer_length )
+        # never cut a multi-byte character in half
+        while window_end < buffer_length and 0x80 <= buffer[ window_end ] < 0xC0:
+            window_end += 1
+        window = bytes( buffer[ window_start : window_end ] )
+        if utf8_rare_space_pattern.search( window ):
+            # unicode whitespace (non-breaking spaces and the like) needs a real decode
+            words += len( window.decode("utf8").split() )
+        else:
+            words += len( window.split() )
+        if previous_ends_in_word and window.startswith( utf8_spaces ) == False:
+            words -= 1
+        previous_ends_in_word = window.endswith( utf8_spaces ) == False
+        window_start = window_end
+    return words
+
+def count_paragraphs( text ):
+    # Blocks of normalize_markdown()'s (stripped) output between blank lines
+    if not text:
+        return 0
+    return 1 + sum( 1 for paragraph_break in paragraph_break_pattern.finditer( text ) )
+
+def count_file_words( file_path ):
+    # Counts the raw (un-normalized) words of a UTF-8 file through mmap
+    with open( file_path, 'rb') as content_file:
+        if os.fstat( content_file.fileno() ).st_size == 0:
+            return 0
+        with mmap.mmap( content_file.fileno(), 0, access=mmap.ACCESS_READ ) as file_buffer:
+            return count_words( file_buffer )
+
+def _compile_order( file_path ):
+    # scenes compile chapter directory by chapter directory, sorted by name
+    return ( os.path.dirname( file_path ), os.path.basename( file_path ) )
+
+def _scan_manuscript( directory ):
+    # (scene path, stat) for every .md file below directory, following the
+    # same rules as os.walk() (symlinked directories are not descended into)
+    scenes = []
+    with os.scandir( directory ) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if entry.is_symlink() == False:
+                    scenes.extend( _scan_manuscript( entry.path ) )
+            elif entry.name.endswith(".md"):
+                scenes.append( ( entry.path, entry.stat() ) )
+    return scenes
+
+def _replacements_signature():
+    replacements = json.dumps( [ normalizer_version, project_index_version, config["replacements"] or {} ], sort_keys=True )
+    return hashlib.sha1( str.encode( replacements ) ).hexdigest()
+
+def _index_entry_current( index_entry, file_stat ):
+    return index_entry is not None and index_entry["mtime"] == file_stat.st_mtime_ns and index_entry["size"] == file_stat.st_size
+
+def _mapped_text_is_plain( buffer ):
+    # True when normalize_markdown() would only strip the text and collapse
+    # blank lines, i.e. no HR markers, replacements or \r in the bytes
+    return all( buffer.find( trigger ) == -1 for trigger in normalize_byte_triggers )
+
+def _utf8_character_at( buffer, position ):
+    lead_byte = buffer[ position ]
+    if lead_byte < 0x80:
+        return chr( lead_byte ), 1
+    length = 2 if lead_byte < 0xE0 else 3 if lead_byte < 0xF0 else 4
+    return buffer[ position:position + length ].decode( "utf8", "replace" ), length
+
+def _mapped_strip_range( buffer ):
+    # (start, end) byte offsets of the text str.strip() would leave
+    start = 0
+    end = len( buffer )
+    while start < end:
+        character, length = _utf8_character_at( buffer, start )
+        if character.isspace() == False:
+            break
+        start += length
+    while end > start:
+        character_start = end - 1
+        while character_start > start and 0x80 <= buffer[ character_start ] < 0xC0:
+            character_start -= 1
+        if _utf8_character_at( buffer, character_start )[0].isspace() == False:
+            break
+        end = character_start
+    return start, end
+
+def _mapped_windows( buffer, start, end ):
+    # Splits buffer[start:end] into windows of about word_count_window
+    # bytes that end on a character boundary and never split a run of
+    # newlines, so "\n\n\n" can be collapsed a window at a time
+    window_start = start
+    while window_start < end:
+        window_end = min( end, window_start + word_count_window )
+        while window_end < end and window_end > window_start and 0x80 <= buffer[ window_end ] < 0xC0:
+            window_end -= 1
+        if window_end == window_start:
+            # a window smaller than the character, take the whole character
+            window_end += _utf8_character_at( buffer, window_start )[1]
+        if window_end < end and buffer[ window_end - 1 ] == 0x0A:
+            run_start = window_end - 1
+            while run_start > window_start and buffer[ run_start - 1 ] == 0x0A:
+                run_start -= 1
+            if run_start > window_start:
+                window_end = run_start
+            else:
+                while window_end < end and buffer[ window_end ] == 0x0A:
+                    window_end += 1
+        yield buffer[ window_start:window_end ]
+        window_start = window_end
+
+def _mapped_scene_counts( buffer ):
+    # (words, characters, paragraphs) of normalize_markdown()'s output for a
+    # plain scene, counted a window at a time over its UTF-8 bytes. Stripping
+    # and collapsing blank lines never changes the word or paragraph count,
+    # the characters are the non-continuation bytes left after the strip
+    # less one for every "\n\n\n" collapsed.
+    start, end = _mapped_strip_range( buffer )
+    characters = 0
+    for window in _mapped_windows( buffer, start, end ):
+        characters += len( window.translate( None, utf8_continuation_bytes ) ) - window.count( b"\n\n\n" )
+    paragraphs = 0
+    if end > start:
+        paragraphs = 1 + sum( 1 for paragraph_break in paragraph_break_byte_pattern.finditer( buffer, start, end ) )
+    return count_words( buffer ), characters, paragraphs
+
+def _mapped_scene_entry( file_path, index_entry ):
+    # Low memory mode: (sha1, words, characters, paragraphs) of a scene without decoding
+    # it, or None when it needs normalize_markdown() (or is empty). The hash
+    # matches the one the text path computes, so switching modes doesn't
+    # recount anything.
+    started = time.perf_counter()
+    with open( file_path, 'rb') as content_file:
+        if os.fstat( content_file.fileno() ).st_size == 0:
+            return None
+        with mmap.mmap( content_file.fileno(), 0, access=mmap.ACCESS_READ ) as buffer:
+            if _mapped_text_is_plain( buffer ) == False:
+                return None
+            content_hash = hashlib.sha1( buffer ).hexdigest()
+            record_timing( "read", started )
+            if index_entry is not None and index_entry["sha1"] == content_hash:
+                return content_hash, index_entry["words"], index_entry["characters"], index_entry["paragraphs"]
+            return ( content_hash, ) + _mapped_scene_counts( buffer )
+
+def scene_chunks( file_path ):
+    # read_scene() a window at a time. In low memory mode a plain scene is
+    # decoded straight from its mmap'ed bytes as it's emitted, so no copy of
+    # the whole scene is ever made; anything else goes through read_scene().
+    if config["lowMemory"]:
+        with open( file_path, 'rb') as content_file:
+            if os.fstat( content_file.fileno() ).st_size > 0:
+                with mmap.mmap( content_file.fileno(), 0, access=mmap.ACCESS_READ ) as buffer:
+                    if _mapped_text_is_plain( buffer ):
+                        start, end = _mapped_strip_range( buffer )
+                        for window in _mapped_windows( buffer, start, end ):
+                            yield window.decode("utf8").replace( "\n\n\n", "\n\n" )
+                        return
+    yield read_scene( file_path )
+
+def scene_index_entry( file_path, index_entry = None, file_stat = None ):
+    # Returns (index entry, changed) for a single scene, only reading the
+    # file when its mtime/size no longer match the index entry and only
+    # re-counting it when the content hash changed too
+    if file_stat is None:
+        file_stat = os.stat( file_path )
+    if _index_entry_current( index_entry, file_stat ):
+        return index_entry, False
+
+    mapped_entry = None
+    if config["lowMemory"]:
+        mapped_entry = _mapped_scene_entry( file_path, index_entry )
+    if mapped_entry is not None:
+        content_hash, words, characters, paragraphs = mapped_entry
+        index_entry = {
+            "words": words,
+            "characters": characters,
+            "paragraphs": paragraphs,
+        }
+    else:
+        started = time.perf_counter()
+        with open( file_path, 'r', encoding="utf8") as content_file:
+            file_contents = content_file.read()
+        record_timing( "read", started )
+        content_hash = hashlib.sha1( str.encode( file_contents ) ).hexdigest()
+        if index_entry is None or index_entry["sha1"] != content_hash:
+            normalized_contents = normalize_markdown( file_contents )
+            index_entry = {
+                "words": count_words( normalized_contents ),
+                "characters": len( normalized_contents ),
+                "paragraphs": count_paragraphs( normalized_contents ),
+            }
+    index_entry = {
+        "mtime": file_stat.st_mtime_ns,
+        "size": file_stat.st_size,
+        "sha1": content_hash,
+        "words": index_entry["words"],
+        "characters": index_entry["characters"],
+        "paragraphs": index_entry["paragraphs"],
+    }
+    return index_entry, True
+
+class ProjectIndex:
+    # Every scene in the manuscript with its stat data, content hash and
+    # normalized word/character counts. Built with one scan per run and
+    # shared by the word counts, progress and exports, then saved to
+    # Progress/ so the next run only has to stat the scenes to trust it.
+
+    def __init__(self):
+        self.scenes = {}
+
+    def scan(self):
+        started = time.perf_counter()
+        saved_scenes = self.load()
+        index_changed = False
+        self.scenes = {}
+        if os.path.isdir( manuscript_dir ):
+            scanned_scenes = _scan_manuscript( manuscript_dir )
+            read_workers = max( 1, int( config["sceneReadWorkers"] ) )
+            changed_scenes = [ ( file_path, file_stat ) for file_path, file_stat in scanned_scenes if not _index_entry_current( saved_scenes.get( file_path ), file_stat ) ]
+            if read_workers > 1 and len( changed_scenes ) > 1:
+                # read the new and edited scenes side by side
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor( max_workers = read_workers ) as read_pool:
+                    changed_entries = read_pool.map( lambda scene: scene_index_entry( scene[0], saved_scenes.get( scene[0] ), scene[1] )[0], changed_scenes )
+                    for ( file_path, file_stat ), index_entry in zip( changed_scenes, changed_entries ):
+                        saved_scenes[ file_path ] = index_entry
+                index_changed = True
+            for file_path, file_stat in scanned_scenes:
+                index_entry, entry_changed = scene_index_entry( file_path, saved_scenes.get( file_path ), file_stat )
+                index_changed = index_changed or entry_changed
+                self.scenes[ file_path ] = index_entry
+
+        if index_changed or len( self.scenes ) != len( saved_scenes ):
+            self.save()
+        record_timing( "scan", started )
+        return self
+
+    def load(self):
+        if os.path.isfile( project_index_file ):
+            try:
+                with open( project_index_file, 'r', encoding="utf8") as index_file:
+                    saved_index = json.load( index_file )
+                # replacements change the normalized text, so a new set invalidates every count
+                if saved_index.get("replacements") == _replacements_signature():
+                    return saved_index.get("scenes", {})
+            except ValueError:
+                if _debug:
+                    print("* Ignoring unreadable project index " + project_index_file)
+        return {}
+
+    def save(self):
+        if os.path.isdir( progress_directory ) == False:
+            os.mkdir( progress_directory )
+        saved_index = {
+            "replacements": _replacements_signature(),
+            "scenes": self.scenes,
+        }
+        # staged next to the index rather than in the build workspace, a
+        # word count builds nothing and shouldn't create one
+        staged_file = staged_file_name( project_index_file )
+        try:
+            with open( staged_file, 'w', encoding="utf8") as index_file:
+                json.dump( saved_index, index_file, indent=1, sort_keys=True )
+            os.replace( staged_file, project_index_file )
+        finally:
+            if os.path.isfile( staged_file ):
+                os.remove( staged_file )
+
+    def update_scene(self, file_path):
+        if os.path.isfile( file_path ):
+            self.scenes[ file_path ] = scene_index_entry( file_path, self.scenes.get( file_path ) )[0]
+        else:
+            self.remove_scene( file_path )
+
+    def remove_scene(self, file_path):
+        self.scenes.pop( file_path, None )
+
+    def move_directory(self, src_path, dest_path):
+        for file_path in list( self.scenes.keys() ):
+            if file_path.startswith( src_path + os.sep ):
+                self.scenes[ dest_path + file_path[ len(src_path): ] ] = self.scenes.pop( file_path )
+
+    def remove_directory(self, src_path):
+        for file_path in list( self.scenes.keys() ):
+            if file_path.startswith( src_path + os.sep ):
+                self.remove_scene( file_path )
+
+    def add_directory(self, directory):
+        # scans a directory that appeared in one go (created, or moved in
+        # from outside the manuscript, which leaves nothing to move)
+        if os.path.isdir( directory ):
+            for file_path, file_stat in _scan_manuscript( directory ):
+                self.scenes[ file_path ] = scene_index_entry( file_path, self.scenes.get( file_path ), file_stat )[0]
+
+    def apply_event(self, event_type, is_directory, src_path, dest_path):
+        # One watchdog event, with manuscript paths ("" for a path outside
+        # the manuscript)
+        if is_directory:
+            if event_type == 'moved':
+                if src_path and dest_path:
+                    self.move_directory( src_path, dest_path )
+                elif dest_path:
+                    self.add_directory( dest_path )
+                else:
+                    self.remove_directory( src_path )
+            elif event_type == 'deleted':
+                self.remove_directory( src_path )
+            elif event_type == 'created':
+                self.add_directory( src_path )
+        elif event_type == 'deleted':
+            self.remove_scene( src_path )
+        elif event_type == 'moved':
+            self.remove_scene( src_path )
+            if dest_path.endswith(".md"):
+                self.update_scene( dest_path )
+        elif src_path.endswith(".md"):
+            self.update_scene( src_path )
+
+    def scene_files(self):
+        return sorted( self.scenes.keys(), key=_compile_order )
+
+    def chapters(self):
+        # [(chapter directory, [scene files])] in compile order
+        chapters = []
+        for file_path in self.scene_files():
+            chapter_directory = os.path.dirname( file_path )
+            if not chapters or chapters[-1][0] != chapter_directory:
+                chapters.append( ( chapter_directory, [] ) )
+            chapters[-1][1].append( file_path )
+        return chapters
+
+    def word_count(self):
+        return sum( index_entry["words"] for index_entry in self.scenes.values() )
+
+    def chapter_word_counts(self):
+        # {chapter name: words}, grouped by directory name
+        chapter_counts = {}
+        for chapter_directory, scene_files in self.chapters():
+            chapter_name = os.path.basename( chapter_directory )
+            chapter_counts[ chapter_name ] = chapter_counts.get( chapter_name, 0 ) + sum( self.scenes[ file_path ]["words"] for file_path in scene_files )
+        return chapter_counts
+
+def project_index( refresh = False ):
+    global current_project_index
+    if current_project_index is None or refresh:
+        current_project_index = ProjectIndex().scan()
+    return current_project_index
+
+def manuscript_chapters():
+    return project_index().chapters()
+
+def manuscript_files():
+    return project_index().scene_files()
+
+def manuscript_word_count():
+    return project_index().word_count()
+
+class NaNoSync:
+    # Sends word counts to NaNoWriMo from a background thread, reusing one
+    # requests.Session (and its connections). A count submitted while one is
+    # being sent replaces any older count still waiting, so there is never
+    # more than one request in flight, and at least min_interval seconds
+    # between requests. A count that can't be delivered after the retries is
+    # kept in Progress/nano-queue.json and goes out with the next sync.
+    def __init__( self, min_interval = 0 ):
+        import requests
+        self.min_interval = min_interval
+        self.last_sent = None
+        self.session = requests.Session()
+        self.condition = threading.Condition()
+        self.pending_count = self.load_queue()
+        self.sending = False
+        self.attempted = False
+        self.closing = False
+        self.thread = threading.Thread( target=self.run, name="nanowrimo-sync", daemon=True )
+        self.thread.start()
+
+    def load_queue(self):
+        if os.path.isfile( nano_queue_file ):
+            try:
+                with open( nano_queue_file, 'r', encoding="utf8") as queue_file:
+                    return int( json.load( queue_file )["words"] )
+            except ( ValueError, KeyError, TypeError ):
+                if _debug:
+                    print("* Ignoring unreadable NaNoWriMo queue " + nano_queue_file)
+        return None
+
+    def save_queue(self):
+        if self.pending_count is None:
+            if os.path.isfile( nano_queue_file ):
+                os.remove( nano_queue_file )
+            return
+        if os.path.isdir( progress_directory ) == False:
+            os.mkdir( progress_directory )
+        with open( nano_queue_file, 'w', encoding="utf8") as queue_file:
+            json.dump( { "words": self.pending_count, "queued": datetime.datetime.now().isoformat() }, queue_file )
+
+    def submit( self, words ):
+        # Queues a count and returns straight away
+        with self.condition:
+            self.pending_count = words
+            self.attempted = False
+            self.save_queue()
+            self.condition.notify_all()
+
+    def flush(self):
+        # Blocks until the queued count has been sent or given up on
+        with self.condition:
+            self.attempted = False
+            self.condition.notify_all()
+            while self.pending_count is not None and self.attempted == False or self.sending:
+                self.condition.wait()
+            return self.pending_count is None
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.session.close()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while ( self.pending_count is None or self.attempted ) and self.closing == False:
+                    self.condition.wait()
+                if self.pending_count is None or self.attempted:
+                    return
+                # rate limit, counts submitted meanwhile replace this one
+                while self.last_sent is not None and self.closing == False and time.monotonic() < self.last_sent + self.min_interval:
+                    self.condition.wait( self.last_sent + self.min_interval - time.monotonic() )
+                if self.closing and self.last_sent is not None and time.monotonic() < self.last_sent + self.min_interval:
+                    # stopped while waiting, it stays queued on disk
+                    return
+                words = self.pending_count
+                self.sending = True
+            delivered = self.send( words )
+            with self.condition:
+                self.last_sent = time.monotonic()
+                self.sending = False
+                if self.pending_count == words:
+                    self.attempted = True
+                    if delivered:
+                        self.pending_count = None
+                    self.save_queue()
+                self.condition.notify_all()
+            if delivered == False:
+                print("* NaNoWriMo sync failed, " + str( words ) + " words are queued in " + nano_queue_file + " for the next sync")
+
+    def send( self, words ):
+        # PUTs the count and reads it back, retrying with exponential backoff
+        # when the site can't be reached. Returns False if it should be
+        # tried again later.
+        import requests
+        import xmltodict
+        the_hash =  str(hashlib.sha1( str.encode(config["nanoWriMoSecretKey"] + config["nanoWriMoUsername"] + str(words)) ).hexdigest() )
         payload = {
             'hash': the_hash,
             'name': config["nanoWriMoUsername"],
-            'wordcount': theword_count
+            'wordcount': words
         }
+        started = time.perf_counter()
+        for attempt in range( max( 0, int( config["nanoWriMoRetries"] ) ) + 1 ):
+            if attempt > 0:
+                time.sleep( nano_retry_backoff_seconds * 2 ** ( attempt - 1 ) )
+            try:
+                update_response = self.session.put( nano_api_url_update_word_count, data=payload, timeout=config["nanoWriMoTimeout"] )
+                if update_response.status_code >= 500:
+                    print("* NaNoWriMo responded " + str( update_response.status_code ) + " (attempt " + str( attempt + 1 ) + ")")
+                    continue
+                current_word_count_response = self.session.get( nano_api_url_current_word_count, timeout=config["nanoWriMoTimeout"] )
+                if current_word_count_response.status_code >= 500:
+                    print("* NaNoWriMo responded " + str( current_word_count_response.status_code ) + " (attempt " + str( attempt + 1 ) + ")")
+                    continue
+            except requests.RequestException as error:
+                print("* Couldn't reach NaNoWriMo (attempt " + str( attempt + 1 ) + "): " + str( error ) )
+                continue
+            record_timing( "nanowrimo.org", started )
 
-        print("* Updating NaNoWriMo update count (currently " + str(theword_count) + ")... Connecting to " + nano_api_url_update_word_count)
+            try:
+                current_word_count = xmltodict.parse(current_word_count_response.text)
+                reported_count = int( current_word_count["wc"]["user_wordcount"] )
+            except Exception:
+                # not the word count xml, usually an unknown username
+                print( "ERROR: NaNoWriMo didn't return a word count - check your NaNoWriMo username" )
+                return True
+            if reported_count == words:
+                print( "* SUCCESS! NaNoWriMo count matches current count")
+            else:
+                # retrying won't help, so the count isn't queued
+                print( "ERROR: NaNoWriMo count does NOT match your current count after update - check your NaNoWriMo secret and username", reported_count, words)
+            return True
+        record_timing( "nanowrimo.org", started )
+        return False
 
-        request_result = requests.put( nano_api_url_update_word_count, data=payload )
+def updateNaNo():
+    if config["nanoWriMoSecretKey"] and config["nanoWriMoUsername"]:
 
-        current_word_count_response = requests.get( nano_api_url_current_word_count )
-        current_word_count = xmltodict.parse(current_word_count_response.text)
+        theword_count = manuscript_word_count() - config["wordCountOffset"]
 
+        print("* Updating NaNoWriMo update count (currently " + str(theword_count) + ")... Connecting to " + nano_api_url_update_word_count)
 
-        if int( current_word_count["wc"]["user_wordcount"]) == theword_count:
-            print( "* SUCCESS! NaNoWriMo count matches current count")
-        else:
-            print( "ERROR: NaNoWriMo count does NOT match your current count after update - check your NaNoWriMo secret and username", current_word_count["wc"]["user_wordcount"], theword_count)
-        #~ if request_result.status_code == 200:
-            #~ print("* NanoWriMo.org responded positive (status code 200). Your word might have been updated.")
-            #~ return True
-        #~ else:
-            #~ print("* NanoWriMo.org responded NEGATIVE. Your word count was not updated")
-            #~ return False
+        nano_sync = NaNoSync()
+        nano_sync.submit( theword_count )
+        nano_sync.flush()
+        nano_sync.close()
     else:
         print("ERROR: Cannot update NaNoWriMo counts - no configuration.")
         print("* Be sure to set your nanoWriMoSecretKey and nanoWriMoUsername in your config.yml.")
 
 
-def pre_process(writeFile = False):
-    if os.path.isdir(export_directory) == False:
-        os.mkdir( export_directory )
-    manuscript_contents = ""
-    for root, dirs, files in sorted(os.walk( manuscript_dir )):
-        path = root.split('/')
-        for file in sorted(files):
-            if file.endswith(".md"):
-                with open(manuscript_dir + "/" + os.path.basename(root) + "/" + file , 'r', encoding="utf8") as content_file:
-                    # get file contents
-                    file_contents = content_file.read()
-
-                    file_contents = normalize_markdown( file_contents )
-                    # add an md HR at the end of the file
-                    manuscript_contents += file_contents + "\n\n----\n\n"
-        # remove final "\n\n----\n\n"
-        if manuscript_contents.endswith("\n\n----\n\n"):
-            manuscript_contents = manuscript_contents[:-len("\n\n----\n\n")]
-            manuscript_contents += "\n\n"
-
-
-    # save contents
-    if writeFile:
-        with open("./temp_work_file.md" , 'w', encoding="utf8") as working_file:
-            working_file.write( manuscript_contents )
-
-    return manuscript_contents
-
-def pre_process_chapters(writeFile = False):
-    if os.path.isdir(export_directory) == False:
-        os.mkdir( export_directory )
-    chapters_manuscript_contents = {}
-    for root, dirs, files in sorted(os.walk( manuscript_dir )):
-        path = root.split('/')
-        for file in sorted(files):
-            if file.endswith(".md"):
-
-                if os.path.basename(root) not in chapters_manuscript_contents:
-                    chapters_manuscript_contents[ os.path.basename(root) ] = ""
-
-                with open(manuscript_dir + "/" + os.path.basename(root) + "/" + file , 'r', encoding="utf8") as content_file:
-                    # get file contents
-                    file_contents = content_file.read()
-
-                    file_contents = normalize_markdown( file_contents )
-                    # add an md HR at the end of the file
-                    chapters_manuscript_contents[ os.path.basename(root) ] += file_contents + "\n\n----\n\n"
-                # remove final "\n\n----\n\n"
-                if chapters_manuscript_contents[ os.path.basename(root) ].endswith("\n\n----\n\n"):
-                    chapters_manuscript_contents[ os.path.basename(root) ] = chapters_manuscript_contents[ os.path.basename(root) ][:-len("\n\n----\n\n")]
-                    chapters_manuscript_contents[ os.path.basename(root) ] += "\n\n"
-
-
-    # save contents
-    # if writeFile:
-    #     with open("./temp_work_file.md" , 'w', encoding="utf8") as working_file:
-    #         working_file.write( manuscript_contents )
+def read_scene( file_path ):
+    started = time.perf_counter()
+    with open( file_path, 'r', encoding="utf8") as content_file:
+        file_contents = content_file.read()
+    record_timing( "read", started )
+    return normalize_markdown( file_contents )
+
+def read_scenes( file_paths ):
+    # read_scene() for each file, in order. With more than one
+    # sceneReadWorkers the files are read and normalized on a thread pool,
+    # keeping at most twice that many scenes ahead of the consumer so the
+    # manuscript still streams.
+    read_workers = max( 1, int( config["sceneReadWorkers"] ) )
+    if read_workers == 1 or len( file_paths ) < 2:
+        for file_path in file_paths:
+            yield read_scene( file_path )
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
+    with ThreadPoolExecutor( max_workers = read_workers ) as read_pool:
+        pending_reads = deque()
+        for file_path in file_paths:
+            pending_reads.append( read_pool.submit( read_scene, file_path ) )
+            if len( pending_reads ) >= read_workers * 2:
+                yield pending_reads.popleft().result()
+        while pending_reads:
+            yield pending_reads.popleft().result()
+
+def manuscript_chunks():
+    # Streams the compiled manuscript one normalized scene at a time. Scenes
+    # within a chapter are separated by an md HR, each chapter ends with a
+    # blank line.
+    chapters = manuscript_chapters()
+    if config["lowMemory"]:
+        for root, scene_files in chapters:
+            for scene_number, file_path in enumerate( scene_files ):
+                if scene_number > 0:
+                    yield scene_separator
+                yield from scene_chunks( file_path )
+            yield "\n\n"
+        return
+    scene_texts = read_scenes( [ file_path for root, scene_files in chapters for file_path in scene_files ] )
+    for root, scene_files in chapters:
+        yield from chapter_chunks( scene_texts, len( scene_files ) )
+
+def chapter_chunks( scene_texts, scene_total ):
+    # One chapter from the next scene_total texts of the scene_texts iterator
+    for scene_number in range( scene_total ):
+        if scene_number > 0:
+            yield scene_separator
+        yield next( scene_texts )
+    yield "\n\n"
+
+def write_manuscript( output_file ):
+    for chunk in manuscript_chunks():
+        output_file.write( chunk )
+
+def build_workspace():
+    # A directory only this run writes its intermediates to, on tmpfs when
+    # there is one, so two builds of the same project (a watch rebuild and a
+    # manual export, say) never write to the same temp file. Removed by
+    # remove_temp_files(), or when the script exits.
+    global build_workspace_directory
+    import tempfile
+    import atexit
+    with build_workspace_lock:
+        if build_workspace_directory is None or os.path.isdir( build_workspace_directory ) == False:
+            parent_directory = None
+            for candidate_directory in build_workspace_parents:
+                if os.path.isdir( candidate_directory ) and os.access( candidate_directory, os.W_OK | os.X_OK ):
+                    parent_directory = candidate_directory
+                    break
+            build_workspace_directory = tempfile.mkdtemp( prefix="enovel-build-", dir=parent_directory )
+            atexit.register( shutil.rmtree, build_workspace_directory, True )
+        return build_workspace_directory
+
+def workspace_file( file_name ):
+    return os.path.join( build_workspace(), file_name )
+
+def staged_file_name( destination ):
+    # a name next to destination only this thread writes to
+    return destination + "." + str( os.getpid() ) + "-" + str( threading.get_ident() ) + ".tmp"
+
+def publish_file( built_file, destination, keep_built_file = False ):
+    # Moves a finished file from the workspace to its destination in one
+    # atomic rename, so anything reading the destination (another build
+    # included) sees the old file or the new one, never half of one. tmpfs is
+    # a different file system, then the file is copied next to the
+    # destination under a name only this thread uses and renamed from there.
+    if keep_built_file == False:
+        try:
+            os.replace( built_file, destination )
+            return
+        except OSError:
+            pass
+    staged_file = staged_file_name( destination )
+    try:
+        shutil.copyfile( built_file, staged_file )
+        os.replace( staged_file, destination )
+    finally:
+        if os.path.isfile( staged_file ):
+            os.remove( staged_file )
+    if keep_built_file == False:
+        os.remove( built_file )
+
+def write_manuscript_export():
+    built_file = workspace_file( os.path.basename( export_file( "md" ) ) )
+    with open( built_file, 'w', encoding="utf8") as md_file:
+        write_manuscript( md_file )
+    publish_file( built_file, export_file( "md" ) )
+
+# markdown syntax plain_text_paragraph() takes out, backslash escapes, code
+# spans and note markers are swapped for private use characters first so
+# nothing inside them is mistaken for markup
+plain_text_protected = dict( ( ord( character ), 0xE000 + ord( character ) ) for character in "\\`*_{}[]()#+-.!<>~^=|:'\"" )
+plain_text_restored = dict( ( protected, character ) for character, protected in plain_text_protected.items() )
+plain_text_escape_pattern = re.compile( r"\\([\\`*_{}\[\]()#+\-.!<>~^=|:'\"])" )
+plain_text_code_pattern = re.compile( r"(`+)(.+?)\1", re.DOTALL )
+plain_text_note_pattern = re.compile( r"\[\^([^\]\s]+)\]|\^\[([^\]]*)\]" )
+plain_text_note_definition_pattern = re.compile( r" {0,3}\[\^([^\]\s]+)\]:[ \t]*" )
+plain_text_html_pattern = re.compile( r"<!--.*?-->|</?[A-Za-z][A-Za-z0-9-]*(?:\s[^<>]*)?/?>", re.DOTALL )
+plain_text_image_pattern = re.compile( r"!\[([^\]]*)\]\([^)]*\)" )
+plain_text_link_pattern = re.compile( r"\[([^\]]+)\](?:\([^)]*\)|\[[^\]]*\])" )
+# underscores inside a word (snake_case) are never emphasis
+plain_text_strong_pattern = re.compile( r"(\*\*|(?<!\w)__)(?=\S)(.+?)(?<=\S)\1(?!(?<=_)\w)", re.DOTALL )
+plain_text_emphasis_pattern = re.compile( r"(\*|(?<!\w)_)(?=\S)(.+?)(?<=\S)\1(?!(?<=_)\w)", re.DOTALL )
+plain_text_heading_pattern = re.compile( r"#{1,6}[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*" )
+plain_text_rule_pattern = re.compile( r" {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*" )
+plain_text_list_pattern = re.compile( r" {0,3}(?:([-*+])|(\d+)([.)]))[ \t]+" )
+plain_text_tex_pattern = re.compile( r"\\[A-Za-z]+(?:\{[^}]*\})*" ) # \newpage from the chapter headers
+plain_text_space_pattern = re.compile( r"[ \t]+" )
+# pandoc's smart extension, quotes open after a space or an opening bracket
+plain_text_opening_double_quote_pattern = re.compile( r"(?:^|(?<=[\s(\[{\u2013\u2014]))\"(?=\S)" )
+plain_text_opening_single_quote_pattern = re.compile( r"(?:^|(?<=[\s(\[{\u2013\u2014]))'(?=\w)" )
+
+def plain_text_notes():
+    # Footnotes collected while converting: numbers in the order they're
+    # referenced, like pandoc, and the text of each once it's defined
+    return dict( numbers = {}, texts = {}, last = None )
+
+def plain_text_note_marker( match, notes ):
+    label = match.group(1)
+    if label is None:
+        # an inline note, ^[text]
+        label = " " + str( len( notes["numbers"] ) )
+        notes["texts"][label] = [ plain_text_inline( match.group(2), notes ).translate( plain_text_restored ) ]
+    if label not in notes["numbers"]:
+        notes["numbers"][label] = len( notes["numbers"] ) + 1
+    return ( "[" + str( notes["numbers"][label] ) + "]" ).translate( plain_text_protected )
+
+def plain_text_smart_punctuation( text ):
+    text = text.replace( "---", "\u2014" ).replace( "--", "\u2013" ).replace( "...", "\u2026" )
+    if '"' in text:
+        text = plain_text_opening_double_quote_pattern.sub( "\u201c", text ).replace( '"', "\u201d" )
+    if "'" in text:
+        text = plain_text_opening_single_quote_pattern.sub( "\u2018", text ).replace( "'", "\u2019" )
+    return text
+
+def plain_text_inline( text, notes ):
+    protecting = "\\" in text or "`" in text or "^" in text
+    if protecting:
+        text = plain_text_escape_pattern.sub( lambda match: match.group(1).translate( plain_text_protected ), text )
+        text = plain_text_code_pattern.sub( lambda match: match.group(2).strip().translate( plain_text_protected ), text )
+        text = plain_text_note_pattern.sub( lambda match: plain_text_note_marker( match, notes ), text )
+    if "<" in text:
+        # raw HTML isn't part of plain text, what's between the tags is
+        text = plain_text_html_pattern.sub( "", text )
+    text = plain_text_image_pattern.sub( r"\1", text )
+    text = plain_text_link_pattern.sub( r"\1", text )
+    text = plain_text_strong_pattern.sub( r"\2", text )
+    text = plain_text_emphasis_pattern.sub( r"\2", text )
+    # the other exports are parsed with pandoc_markdown_arg, where smart
+    # punctuation is on unless it's turned off there
+    if "-smart" not in pandoc_markdown_arg:
+        text = plain_text_smart_punctuation( text )
+    if protecting:
+        text = text.translate( plain_text_restored )
+    return text
+
+def wrap_plain_text( text, indent = "" ):
+    # textwrap.fill() for text whose only whitespace is single spaces, at a
+    # fraction of the cost. Words longer than a line aren't broken.
+    width = plain_text_columns - len( indent )
+    lines = []
+    while len( text ) > width:
+        line_end = text.rfind( " ", 0, width + 1 )
+        if line_end < 0:
+            line_end = text.find( " ", width )
+            if line_end < 0:
+                break
+        lines.append( indent + text[ : line_end ] )
+        text = text[ line_end + 1 : ]
+    lines.append( indent + text )
+    return "\n".join( lines )
+
+def plain_text_list( lines, notes, indent = "" ):
+    # A tight list the way pandoc writes one: "-   " for bullets, numbers
+    # counted on from the first item, and every item reflowed under its text
+    items = []
+    for line in lines:
+        marker = plain_text_list_pattern.match( line )
+        if marker:
+            items.append( [ line[ marker.end(): ] ] )
+        else:
+            items[-1].append( line )
+    first_marker = plain_text_list_pattern.match( lines[0] )
+    list_lines = []
+    for item_number, item_lines in enumerate( items ):
+        if first_marker.group(1):
+            marker = "-"
+        else:
+            marker = str( int( first_marker.group(2) ) + item_number ) + first_marker.group(3)
+        item_text = wrap_plain_text( plain_text_space_pattern.sub( " ", plain_text_inline( " ".join( line.strip() for line in item_lines ), notes ) ).strip(), indent + "    " )
+        list_lines.append( indent + marker.ljust( 3 ) + " " + item_text[ len( indent ) + 4: ] )
+    return "\n".join( list_lines )
+
+def plain_text_paragraph( paragraph, notes ):
+    # One markdown paragraph (no blank lines in it) as plain text: headings
+    # and rules on their own, lists and hard line breaks keep their lines,
+    # code stays as typed, everything else is reflowed to plain_text_columns.
+    # Footnote definitions are kept in notes for plain_text_chunks().
+    raw_lines = paragraph.strip("\n").split("\n")
+    lines = [ line.rstrip() for line in raw_lines ]
+    note_label, notes["last"] = notes["last"], None
+    if not any( lines ) or all( plain_text_tex_pattern.fullmatch( line.strip() ) for line in lines ):
+        return ""
+    code_lines = all( line.startswith( ( "    ", "\t" ) ) or line == "" for line in lines )
+    if code_lines and note_label is not None:
+        # another paragraph of the footnote above
+        notes["texts"][note_label].append( plain_text_paragraph( "\n".join( line[4:] if line.startswith("    ") else line[1:] for line in lines ), notes ) )
+        notes["last"] = note_label
+        return ""
+    if code_lines:
+        return "\n".join( "    " + line[4:] if line.startswith("    ") else "    " + line[1:] if line else "" for line in lines )
+    note_definition = plain_text_note_definition_pattern.match( lines[0] )
+    if note_definition:
+        note_lines = [ lines[0][ note_definition.end(): ] ] + lines[1:]
+        notes["texts"][ note_definition.group(1) ] = [ plain_text_space_pattern.sub( " ", plain_text_inline( " ".join( line.strip() for line in note_lines ), notes ) ).strip() ]
+        notes["last"] = note_definition.group(1)
+        return ""
+    if len( lines ) == 1 and plain_text_rule_pattern.fullmatch( lines[0] ):
+        return "-" * plain_text_columns
+    heading = plain_text_heading_pattern.fullmatch( lines[0] )
+    if heading:
+        # a heading doesn't need a blank line after it
+        return "\n\n".join( filter( None, [ plain_text_inline( heading.group(1), notes ), plain_text_paragraph( "\n".join( lines[1:] ), notes ) ] ) )
+    if len( lines ) == 2 and lines[1] and lines[1].strip("=") == "":
+        return plain_text_inline( lines[0].strip(), notes )
+
+    indent = ""
+    if all( line.startswith(">") for line in lines ):
+        indent = "  "
+        lines = [ line[2:] if line.startswith("> ") else line[1:] for line in lines ]
+    if plain_text_list_pattern.match( lines[0] ):
+        return plain_text_list( lines, notes, indent )
+    # a line ending in a backslash or two spaces is a hard line break, the
+    # text either side of it is reflowed on its own
+    text = ""
+    for line_number, line in enumerate( lines ):
+        if line_number == len( lines ) - 1:
+            text += line.strip()
+        elif line.endswith("\\"):
+            text += line[:-1].strip() + "\n"
+        elif raw_lines[ line_number ].endswith("  "):
+            text += line.strip() + "\n"
+        else:
+            text += line.strip() + " "
+    text = plain_text_space_pattern.sub( " ", plain_text_inline( text, notes ) )
+    return "\n".join( wrap_plain_text( line.strip(), indent ) for line in text.split("\n") )
+
+def plain_text_chunks( markdown_chunks ):
+    # Converts streamed markdown to plain text a paragraph at a time, only
+    # the unfinished paragraph at the end of a chunk is held back. Footnotes
+    # go at the end, like pandoc puts them.
+    pending_text = ""
+    first_paragraph = True
+    notes = plain_text_notes()
+    for chunk in markdown_chunks:
+        pending_text += chunk
+        paragraphs_end = pending_text.rfind("\n\n")
+        if paragraphs_end < 0:
+            continue
+        paragraphs, pending_text = pending_text[ : paragraphs_end ], pending_text[ paragraphs_end + 2 : ]
+        for paragraph in paragraphs.split("\n\n"):
+            paragraph = plain_text_paragraph( paragraph, notes )
+            if paragraph:
+                yield paragraph if first_paragraph else "\n\n" + paragraph
+                first_paragraph = False
+    paragraphs = [ plain_text_paragraph( pending_text, notes ) ]
+    for label, number in notes["numbers"].items():
+        if label in notes["texts"]:
+            note_paragraphs = notes["texts"][label]
+            paragraphs.append( "\n\n".join( [ wrap_plain_text( "[" + str( number ) + "] " + note_paragraphs[0] ) ] + note_paragraphs[1:] ) )
+    for paragraph in paragraphs:
+        if paragraph:
+            yield paragraph if first_paragraph else "\n\n" + paragraph
+            first_paragraph = False
+    yield "\n"
+
+def write_text_export():
+    # The .txt is written straight from the normalized scenes, no pandoc
+    built_file = workspace_file( os.path.basename( export_file( "txt" ) ) )
+    with open( built_file, 'w', encoding="utf8") as text_file:
+        for chunk in plain_text_chunks( manuscript_chunks() ):
+            text_file.write( chunk )
+    publish_file( built_file, export_file( "txt" ) )
+
+native_export_writers = dict(
+    md = write_manuscript_export,
+    txt = write_text_export,
+)
 
-    return chapters_manuscript_contents
+def book_metadata():
+    file_contents = "---\n"
+    file_contents += "title: " + config["bookName"] + "\n"
+    file_contents += "author: " + config["authorName"] + "\n"
+    file_contents += "rights:  " + config["copyRight"] + "\n"
+    file_contents += "language: " + config["languageCode"] + "\n"
+    file_contents += "geometry: margin=3cm\n"
+    file_contents += "fontsize: " + config["pdfFontSize"] + "\n"
+    file_contents += "publisher: " + config["publisherName"] + "\n"
+    if "coverImage" in config and config["coverImage"] != "":
+        file_contents += "cover-image: " + config["coverImage"] + "\n"
+    file_contents += "...\n"
+    return file_contents
 
-def create_book_metadata():
-    if recreate_epub_and_temp_files == True:
-        file_contents = "---\n"
-        file_contents += "title: " + config["bookName"] + "\n"
-        file_contents += "author: " + config["authorName"] + "\n"
-        file_contents += "rights:  " + config["copyRight"] + "\n"
-        file_contents += "language: " + config["languageCode"] + "\n"
-        file_contents += "geometry: margin=3cm\n"
-        file_contents += "fontsize: " + config["pdfFontSize"] + "\n"
-        file_contents += "publisher: " + config["publisherName"] + "\n"
-        if "coverImage" in config and config["coverImage"] != "":
-            file_contents += "cover-image: " + config["coverImage"] + "\n"
-        file_contents += "...\n"
-        with open("./" + "00-ebook-info.txt" , 'w', encoding="utf8") as meta_file:
-            meta_file.write( file_contents )
+def pandoc_from_manuscript( pandoc_args ):
+    # Streams the metadata block and the manuscript straight into pandoc's
+    # stdin so no intermediate copy of the book is written or held in memory
+    if os.path.isdir(export_directory) == False:
+        os.mkdir( export_directory )
+    try:
+        pandoc = subprocess.Popen( ["pandoc"] + pandoc_args, stdin=subprocess.PIPE )
+    except OSError as error:
+        # most likely pandoc isn't installed
+        print("ERROR: " + str( error ) )
+        return 127
+    try:
+        with io.TextIOWrapper( pandoc.stdin, encoding="utf8" ) as pandoc_input:
+            pandoc_input.write( book_metadata() + "\n" )
+            write_manuscript( pandoc_input )
+    except BrokenPipeError:
+        # pandoc exited early, its own error output says why
+        pass
+    return pandoc.wait()
 
 def remove_temp_files():
-    if os.path.isfile("./temp_work_file.md"):
-        os.remove( "./temp_work_file.md" )
-    if os.path.isfile("./" + "00-ebook-info.txt"):
-        os.remove( "./" + "00-ebook-info.txt" )
+    global build_workspace_directory
+    with build_workspace_lock:
+        if build_workspace_directory is not None:
+            shutil.rmtree( build_workspace_directory, ignore_errors=True )
+            build_workspace_directory = None
     tmp_pdf_conv = glob("tex2pdf.*")
     for tmp_dir in tmp_pdf_conv:
         os.rmdir( tmp_dir )
 
 
 
-def save_progress( dont_draw_graphs = False):
+class ProgressStore:
+    # Append-only log of timestamped word counts in Progress/progress.sqlite,
+    # plus one summary row per day (that day's latest count and the count it
+    # started from) so today's progress is a single key lookup and the graphs
+    # are a range query. An existing progress.tsv is imported when the store
+    # is first created.
+    #
+    # Scene counts are kept as deltas: each snapshot only gets a file_changes
+    # row for the scenes whose count moved, and files holds every scene's
+    # latest count to diff the next save against. Summing the deltas gives
+    # progress by scene or chapter over any range of time.
+    #
+    # read_only opens an existing store without creating or importing
+    # anything, for the commands that only report on it.
+
+    def __init__(self, database_file, read_only = False):
+        import sqlite3
+        if read_only:
+            from urllib.parse import quote
+            self.connection = sqlite3.connect( "file:" + quote( database_file ) + "?mode=ro", uri=True )
+            return
+        creating_store = os.path.isfile( database_file ) == False
+        self.connection = sqlite3.connect( database_file )
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                recorded_at TEXT NOT NULL,
+                words INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_recorded_at ON snapshots ( recorded_at );
+            CREATE TABLE IF NOT EXISTS days (
+                day TEXT PRIMARY KEY,
+                start_words INTEGER NOT NULL,
+                words INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                chapter TEXT NOT NULL,
+                words INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS file_changes (
+                snapshot INTEGER NOT NULL,
+                file INTEGER NOT NULL,
+                delta INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS file_changes_snapshot ON file_changes ( snapshot );
+        ''')
+        if creating_store and os.path.isfile( progress_directory + "/progress.tsv" ):
+            self.import_tsv( progress_directory + "/progress.tsv" )
+
+    def import_tsv(self, tsv_file):
+        with open( tsv_file, 'r', encoding="utf8") as content_file:
+            for line in content_file:
+                if line.strip():
+                    entryDate, word_count = line.strip().split('\t')
+                    self.record( int(word_count), datetime.datetime.strptime( entryDate, "%Y-%m-%d" ) )
+
+    def record(self, words, recorded_at = None, scene_words = None):
+        # scene_words ({scene path: words}) adds the per scene deltas
+        if recorded_at is None:
+            recorded_at = datetime.datetime.now()
+        day = recorded_at.date().isoformat()
+
+        # only log actual changes, watch mode saves far more often than the count moves
+        last_snapshot = self.connection.execute( "SELECT words FROM snapshots ORDER BY rowid DESC LIMIT 1" ).fetchone()
+        file_changes = []
+        if scene_words is not None:
+            file_changes = self.file_changes( scene_words )
+            if file_changes and last_snapshot is not None and self.connection.execute( "SELECT 1 FROM file_changes LIMIT 1" ).fetchone() is None:
+                # the first scene counts of a store that already has history
+                # are where the scenes stood before it, not today's writing
+                self.connection.executemany( "INSERT INTO file_changes ( snapshot, file, delta ) VALUES ( 0, ?, ? )", file_changes )
+                file_changes = []
+        if last_snapshot is None or last_snapshot[0] != words or file_changes:
+            snapshot = self.connection.execute( "INSERT INTO snapshots ( recorded_at, words ) VALUES ( ?, ? )", ( recorded_at.isoformat( timespec="seconds" ), words ) ).lastrowid
+            self.connection.executemany( "INSERT INTO file_changes ( snapshot, file, delta ) VALUES ( ?, ?, ? )", [ ( snapshot, file_id, delta ) for file_id, delta in file_changes ] )
+
+        day_row = self.connection.execute( "SELECT words FROM days WHERE day = ?", ( day, ) ).fetchone()
+        if day_row is None:
+            previous_day = self.connection.execute( "SELECT words FROM days WHERE day < ? ORDER BY day DESC LIMIT 1", ( day, ) ).fetchone()
+            self.connection.execute( "INSERT INTO days ( day, start_words, words ) VALUES ( ?, ?, ? )", ( day, previous_day[0] if previous_day else 0, words ) )
+        elif day_row[0] != words:
+            self.connection.execute( "UPDATE days SET words = ? WHERE day = ?", ( words, day ) )
+        self.connection.commit()
+
+    def file_changes(self, scene_words):
+        # [(file id, words gained)] for every scene whose count differs from
+        # the last record, a deleted scene loses all its words. files is
+        # updated to match.
+        known_files = dict( ( path, ( file_id, words ) ) for file_id, path, words in self.connection.execute( "SELECT id, path, words FROM files" ) )
+        file_changes = []
+        for path, words in scene_words.items():
+            if path not in known_files:
+                file_id = self.connection.execute( "INSERT INTO files ( path, chapter, words ) VALUES ( ?, ?, 0 )", ( path, os.path.basename( os.path.dirname( path ) ) ) ).lastrowid
+                if words:
+                    file_changes.append( ( file_id, words ) )
+            elif known_files[ path ][1] != words:
+                file_changes.append( ( known_files[ path ][0], words - known_files[ path ][1] ) )
+        for path, ( file_id, words ) in known_files.items():
+            if path not in scene_words and words:
+                file_changes.append( ( file_id, -words ) )
+        self.connection.executemany( "UPDATE files SET words = words + ? WHERE id = ?", [ ( delta, file_id ) for file_id, delta in file_changes ] )
+        return file_changes
+
+    def file_words(self):
+        # {scene path: words} as of the last record
+        return dict( self.connection.execute( "SELECT path, words FROM files WHERE words != 0" ).fetchall() )
+
+    def daily_chapter_progress(self, first_day = "", last_day = "9999-12-31"):
+        # [(day, chapter, words gained)] oldest first, only chapters that moved
+        return self.connection.execute( '''
+            SELECT substr( snapshots.recorded_at, 1, 10 ) AS day, files.chapter, SUM( file_changes.delta )
+            FROM file_changes
+            JOIN snapshots ON snapshots.rowid = file_changes.snapshot
+            JOIN files ON files.id = file_changes.file
+            WHERE snapshots.recorded_at >= ? AND snapshots.recorded_at <= ?
+            GROUP BY day, files.chapter
+            HAVING SUM( file_changes.delta ) != 0
+            ORDER BY day, files.chapter
+        ''', ( first_day, last_day + "T23:59:59" ) ).fetchall()
+
+    def todays_progress(self):
+        day_row = self.connection.execute( "SELECT words - start_words FROM days WHERE day = ?", ( datetime.date.today().isoformat(), ) ).fetchone()
+        return day_row[0] if day_row else 0
+
+    def daily_totals(self, first_day = "", last_day = "9999-12-31"):
+        # [(day, that day's latest word count)] oldest first
+        return self.connection.execute( "SELECT day, words FROM days WHERE day >= ? AND day <= ? ORDER BY day", ( first_day, last_day ) ).fetchall()
+
+    def snapshots(self, first_time = "", last_time = "9999-12-31T23:59:59"):
+        # [(iso timestamp, word count)] oldest first
+        return self.connection.execute( "SELECT recorded_at, words FROM snapshots WHERE recorded_at >= ? AND recorded_at <= ? ORDER BY recorded_at", ( first_time, last_time ) ).fetchall()
+
+    def close(self):
+        self.connection.close()
+
+def save_progress( dont_draw_graphs = False, currentword_count = None ):
     global todays_progress
-    _set_pandoc_args()
 
     if os.path.isdir( progress_directory ) == False:
         os.mkdir( progress_directory )
-    manuscript_data = pre_process()
-    manuscript_data = normalize_markdown( manuscript_data )
-    currentword_count = len(manuscript_data.split())
-    word_count_dict = {}
+    if currentword_count is None:
+        currentword_count = manuscript_word_count()
+
+    scene_words = dict( ( file_path, index_entry["words"] ) for file_path, index_entry in list( project_index().scenes.items() ) )
+    progress_store = ProgressStore( progress_database_file )
+    try:
+        progress_store.record( currentword_count, scene_words = scene_words )
+        todays_progress = progress_store.todays_progress()
+        if dont_draw_graphs:
+            # watch mode, just log the count
+            return
+        word_count_dict = dict( progress_store.daily_totals() )
+        chapter_progress = progress_store.daily_chapter_progress()
+    finally:
+        progress_store.close()
+
+    write_progress_tsv( word_count_dict )
+    if found_matplotlib:
+        started = time.perf_counter()
+        draw_progress_graphs( word_count_dict, chapter_progress )
+        record_timing( "graph", started )
+
+def load_saved_scene_words():
+    # every scene's words at the last save, what stats measures "changed" against
+    import sqlite3
+    if os.path.isfile( progress_database_file ) == False:
+        return {}
+    progress_store = ProgressStore( progress_database_file, read_only = True )
+    try:
+        return progress_store.file_words()
+    except sqlite3.OperationalError:
+        # a store from before scene counts were kept
+        return {}
+    finally:
+        progress_store.close()
+
+def chapter_history( days ):
+    # [(day, chapter, words gained)] for the last `days` days, from the
+    # stored scene deltas
+    if os.path.isfile( progress_database_file ) == False:
+        return []
+    import sqlite3
+    first_day = ( datetime.date.today() - datetime.timedelta( days = days - 1 ) ).isoformat()
+    progress_store = ProgressStore( progress_database_file, read_only = True )
+    try:
+        return progress_store.daily_chapter_progress( first_day )
+    except sqlite3.OperationalError:
+        # a store from before scene counts were kept
+        return []
+    finally:
+        progress_store.close()
+
+def history():
+    chapter_progress = chapter_history( command_options["days"] )
+    if command_options["output_format"] == "json":
+        json.dump( [ dict( day = day, chapter = chapter, words = words ) for day, chapter, words in chapter_progress ], sys.stdout, indent=1 )
+        print("")
+        return
+    if command_options["output_format"] == "csv":
+        import csv
+        history_writer = csv.writer( sys.stdout, lineterminator="\n" )
+        history_writer.writerow( ( "day", "chapter", "words" ) )
+        history_writer.writerows( chapter_progress )
+        return
+
+    print("  -------------- Progress by Chapter -----------------" )
+    if not chapter_progress:
+        print("  Nothing written in the last " + str( command_options["days"] ) + " days")
+        return
+    rpad_length = max( len( chapter ) for day, chapter, words in chapter_progress )
+    shown_day = None
+    for day, chapter, words in chapter_progress:
+        if day != shown_day:
+            print("  " + day )
+            shown_day = day
+        print( "    " + chapter.rjust( rpad_length ) + ": " + "%+d" % words )
+
+def write_progress_tsv( word_count_dict ):
+    # progress.tsv is an export of the daily totals for spreadsheets, the
+    # store is the record
+    progress_contents = ""
+    for entryDate in sorted(word_count_dict.keys()):
+        progress_contents += str(entryDate) + "\t" + str(word_count_dict[entryDate]) + "\n"
+
+    saved_progress = ""
     if os.path.isfile( progress_directory + "/progress.tsv"):
         with open( progress_directory + "/progress.tsv" , 'r', encoding="utf8") as content_file:
-            # get file contents
-            for line in content_file:
-                entryDate, word_count = map(str, line.strip().split('\t') )
-                word_count_dict[entryDate] = word_count
+            saved_progress = content_file.read()
+
+    # leave the file (and its mtime) alone when nothing changed
+    if progress_contents != saved_progress:
+        with open( progress_directory + "/progress.tsv" , 'w', encoding="utf8") as content_file:
+            content_file.write( progress_contents )
+
+def draw_progress_graphs( word_count_dict, chapter_progress = () ):
+    graph_format = str( config["graphFormat"] ).lower()
+    if graph_format == "none":
+        return
+
+    # Only redraw when the progress (or how it's drawn) has changed since the last time
+    graph_files = [ progress_directory + "/progress-overall." + graph_format, progress_directory + "/progress-daily." + graph_format ]
+    if chapter_progress:
+        graph_files.append( progress_directory + "/progress-chapters." + graph_format )
+    graph_signature_file = progress_directory + "/progress-graphs.sha1"
+    graph_signature = hashlib.sha1( str.encode( json.dumps( [
+        graph_format,
+        config["graphDPI"],
+        config["bookName"],
+        [ [ entryDate, int(word_count_dict[entryDate]) ] for entryDate in sorted(word_count_dict.keys()) ],
+        [ list( chapter_day ) for chapter_day in chapter_progress ],
+    ] ) ) ).hexdigest()
+    if all( os.path.isfile( graph_file ) for graph_file in graph_files ) and os.path.isfile( graph_signature_file ):
+        with open( graph_signature_file, 'r', encoding="utf8") as signature_file:
+            if signature_file.read() == graph_signature:
+                return
+
+    import matplotlib
+    # render off-screen, there's no window to draw to
+    matplotlib.use("Agg")
+    import numpy as np
+    import matplotlib.pyplot as plt
+    if graph_format == "svg":
+        # keep the labels as SVG text rather than thousands of glyph paths
+        plt.rcParams["svg.fonttype"] = "none"
 
-    word_count_dict[ str( datetime.date.today())] = currentword_count
+    #Create Overall Progress Graph
+    graphX = []
+    graphY = []
 
-    lastCount = 0
     for entryDate in sorted(word_count_dict.keys()):
-        if str(datetime.date.today()) == entryDate:
-            todays_progress = int(word_count_dict[ entryDate ]) - lastCount
-        lastCount = int(word_count_dict[ entryDate ])
+        graphX.append(entryDate)
+        graphY.append( int(word_count_dict[ entryDate ]) )
 
-    with open( progress_directory + "/progress.tsv" , 'w', encoding="utf8") as content_file:
-        for entryDate in sorted(word_count_dict.keys()):
-            content_file.write( str(entryDate) + "\t" + str(word_count_dict[entryDate]) + "\n")
+    overallGraphNumCols = len(graphX)
+    overallGraphLocations = np.arange(overallGraphNumCols)  # the x locations for the groups
+    overallGraphBarWidth = 0.37       # the width of the bars
 
-    if found_matplotlib and dont_draw_graphs == False:
+    overallGraphFig, overallGraphAX = plt.subplots()
+    figureWidth = (len(graphX) / 10 * 3)
+    if figureWidth < 10:
+        figureWidth = 10
+    overallGraphFig.set_size_inches(figureWidth, 5)
 
-        #Create Overall Progress Graph
-        graphX = []
-        graphY = []
+    rects1 = overallGraphAX.bar(overallGraphLocations, graphY, overallGraphBarWidth, color='r')
 
-        for entryDate in sorted(word_count_dict.keys()):
-            graphX.append(entryDate)
-            graphY.append( int(word_count_dict[ entryDate ]) )
+    # add some text for labels, title and axes ticks
+    overallGraphAX.set_ylabel('Word Count')
+    overallGraphAX.set_title('Overall Word Count Progress for "' + config["bookName"] + '"' )
+    overallGraphAX.set_xticks(overallGraphLocations + overallGraphBarWidth)
+    overallGraphAX.set_xticklabels(graphX,  ha='center', rotation=90 )
 
-        overallGraphNumCols = len(graphX)
-        overallGraphLocations = np.arange(overallGraphNumCols)  # the x locations for the groups
-        overallGraphBarWidth = 0.37       # the width of the bars
+    overallGraphRects = overallGraphAX.patches
 
-        overallGraphFig, overallGraphAX = plt.subplots()
-        figureWidth = (len(graphX) / 10 * 3)
-        if figureWidth < 10:
-            figureWidth = 10
-        overallGraphFig.set_size_inches(figureWidth, 5)
+    for overallRect, overallLabel in zip(overallGraphRects, graphY):
+        labelHeight = overallRect.get_height()
+        overallGraphAX.text(overallRect.get_x() + overallRect.get_width()/2, labelHeight + 10, overallLabel, ha='center', va='bottom', rotation=90 )
 
-        rects1 = overallGraphAX.bar(overallGraphLocations, graphY, overallGraphBarWidth, color='r')
+    plt.savefig(graph_files[0], bbox_inches='tight', format=graph_format, dpi=config["graphDPI"])
 
-        # add some text for labels, title and axes ticks
-        overallGraphAX.set_ylabel('Word Count')
-        overallGraphAX.set_title('Overall Word Count Progress for "' + config["bookName"] + '"' )
-        overallGraphAX.set_xticks(overallGraphLocations + overallGraphBarWidth)
-        overallGraphAX.set_xticklabels(graphX,  ha='center', rotation=90 )
+    plt.close(overallGraphFig)
 
-        overallGraphRects = overallGraphAX.patches
+    #Create Daily Progress Graph
+    graphX = []
+    graphY = []
 
-        for overallRect, overallLabel in zip(overallGraphRects, graphY):
-            labelHeight = overallRect.get_height()
-            overallGraphAX.text(overallRect.get_x() + overallRect.get_width()/2, labelHeight + 10, overallLabel, ha='center', va='bottom', rotation=90 )
 
-        plt.savefig(progress_directory + "/progress-overall.png", bbox_inches='tight', dpi=300)
 
-        overallGraphFig.clf()
-        plt.clf()
+    lastCount = 0
+    for entryDate in sorted(word_count_dict.keys()):
+        graphX.append(entryDate)
+        graphY.append( int(word_count_dict[ entryDate ]) - lastCount )
+        lastCount = int(word_count_dict[ entryDate ])
+
+    dailyGraphNumCols = len(graphX)
+    dailyGraphLocations = np.arange(dailyGraphNumCols)  # the x locations for the groups
+    dailyGraphWidth = 0.38 # the width of the bars
+
+    dailyGraphFig, dailyGraphAX = plt.subplots()
+    rects1 = dailyGraphAX.bar(dailyGraphLocations, graphY, dailyGraphWidth, color='r')
 
-        #Create Daily Progress Graph
-        graphX = []
-        graphY = []
+    figureWidth = (len(graphX) / 10 * 3)
+    if figureWidth < 10:
+        figureWidth = 10
+    dailyGraphFig.set_size_inches( figureWidth, 5)
 
+    # add some text for labels, title and axes ticks
+    dailyGraphAX.set_ylabel('Word Count')
+    dailyGraphAX.set_title('Daily Word Count Progress for "' + config["bookName"] + '"' )
+    dailyGraphAX.set_xticks( dailyGraphLocations + dailyGraphWidth )
+    dailyGraphAX.set_xticklabels(graphX,  ha='center', rotation=90 )
 
+    dailyGraphRects = dailyGraphAX.patches
 
-        lastCount = 0
-        for entryDate in sorted(word_count_dict.keys()):
-            graphX.append(entryDate)
-            graphY.append( int(word_count_dict[ entryDate ]) - lastCount )
-            lastCount = int(word_count_dict[ entryDate ])
+    for dailyRect, dailyLabel in zip(dailyGraphRects, graphY):
+        labelHeight = dailyRect.get_height()
+        dailyGraphAX.text(dailyRect.get_x() + dailyRect.get_width()/2, labelHeight + 10, dailyLabel, ha='center', va='bottom', rotation=90 )
 
-        dailyGraphNumCols = len(graphX)
-        dailyGraphLocations = np.arange(dailyGraphNumCols)  # the x locations for the groups
-        dailyGraphWidth = 0.38 # the width of the bars
 
-        dailyGraphFig, dailyGraphAX = plt.subplots()
-        rects1 = dailyGraphAX.bar(dailyGraphLocations, graphY, dailyGraphWidth, color='r')
+    plt.savefig(graph_files[1], bbox_inches='tight', format=graph_format, dpi=config["graphDPI"])
 
+    plt.close(dailyGraphFig)
+
+    #Create Daily Progress by Chapter Graph, one stacked bar segment per chapter
+    if chapter_progress:
+        graphX = sorted( set( day for day, chapter, words in chapter_progress ) )
+        chapterNames = sorted( set( chapter for day, chapter, words in chapter_progress ) )
+        chapterWords = dict( ( ( day, chapter ), words ) for day, chapter, words in chapter_progress )
+
+        chapterGraphLocations = np.arange(len(graphX))
+        chapterGraphWidth = 0.38
+
+        chapterGraphFig, chapterGraphAX = plt.subplots()
         figureWidth = (len(graphX) / 10 * 3)
         if figureWidth < 10:
             figureWidth = 10
-        dailyGraphFig.set_size_inches( figureWidth, 5)
-
-        # add some text for labels, title and axes ticks
-        dailyGraphAX.set_ylabel('Word Count')
-        dailyGraphAX.set_title('Daily Word Count Progress for "' + config["bookName"] + '"' )
-        dailyGraphAX.set_xticks( dailyGraphLocations + dailyGraphWidth )
-        dailyGraphAX.set_xticklabels(graphX,  ha='center', rotation=90 )
+        chapterGraphFig.set_size_inches( figureWidth, 5)
 
-        dailyGraphRects = dailyGraphAX.patches
+        # words written stack up from zero, words cut stack down from it
+        gainedBottoms = np.zeros(len(graphX))
+        lostBottoms = np.zeros(len(graphX))
+        for chapterName in chapterNames:
+            graphY = np.array( [ chapterWords.get( ( day, chapterName ), 0 ) for day in graphX ] )
+            graphBottoms = np.where( graphY >= 0, gainedBottoms, lostBottoms )
+            chapterGraphAX.bar(chapterGraphLocations, graphY, chapterGraphWidth, bottom=graphBottoms, label=chapterName)
+            gainedBottoms += np.where( graphY > 0, graphY, 0 )
+            lostBottoms += np.where( graphY < 0, graphY, 0 )
 
-        for dailyRect, dailyLabel in zip(dailyGraphRects, graphY):
-            labelHeight = dailyRect.get_height()
-            dailyGraphAX.text(dailyRect.get_x() + dailyRect.get_width()/2, labelHeight + 10, dailyLabel, ha='center', va='bottom', rotation=90 )
+        chapterGraphAX.set_ylabel('Word Count')
+        chapterGraphAX.set_title('Daily Word Count Progress by Chapter for "' + config["bookName"] + '"' )
+        chapterGraphAX.set_xticks( chapterGraphLocations )
+        chapterGraphAX.set_xticklabels(graphX,  ha='center', rotation=90 )
+        chapterGraphAX.legend( loc='upper left', bbox_to_anchor=(1, 1), fontsize='small' )
 
+        plt.savefig(graph_files[2], bbox_inches='tight', format=graph_format, dpi=config["graphDPI"])
 
-        plt.savefig(progress_directory + "/progress-daily.png", bbox_inches='tight', dpi=300)
+        plt.close(chapterGraphFig)
 
-        dailyGraphFig.clf()
-        plt.clf()
+    with open( graph_signature_file, 'w', encoding="utf8") as signature_file:
+        signature_file.write( graph_signature )
 
 def print_help():
     print( "Usage:" )
@@ -461,9 +1796,30 @@ def print_help():
     print( "    enovel-project newchapter   Alias to enovel-project chapter" )
     print( "    enovel-project word_count    Gives you a current word_count of your manuscript" )
     print( "    enovel-project wc           Alias to enovel-project word_count" )
+    print( "    enovel-project stats        Words, characters, paragraphs and words changed")
+    print( "                                since the last save for every scene and chapter" )
+    print( "    enovel-project history      Words written per chapter each day, from the")
+    print( "                                saved progress (last --days N days, default 14)" )
     print( "    enovel-project nano         If your nanowrimo username and secret is in")
     print("                                the config, this will attempt to update your ")
     print("                                nanowrimo daily stat automatically." )
+    print( "    enovel-project batch DIR... Runs all (or --run) in each project directory,")
+    print( "                                several at once, and prints a summary" )
+    print( "Options:" )
+    print( "    --jobs N                    Run up to N export conversions at once for")
+    print( "                                all and ebooks (default: number of CPUs)" )
+    print( "    --force                     Rebuild exports even if nothing has changed" )
+    print( "    --incremental               Build the epub chapter by chapter, only")
+    print( "                                re-rendering chapters that changed" )
+    print( "    --build epub,html           With watch, rebuild these exports after every" )
+    print( "                                change" )
+    print( "    --timings                   Print how long each step took" )
+    print( "    --timing-log                Append the step timings to Progress/timings.jsonl" )
+    print( "    --profile[=FILE]            Save a cProfile dump (default: Progress/profile-*.prof)" )
+    print( "    --run all,wc                What batch runs in each project (default: all)" )
+    print( "    --results FILE              Save the batch summary as JSON" )
+    print( "    --json, --csv               Print stats or history as JSON or CSV instead" )
+    print( "                                of a table" )
 
 def directoryCount(path):
     dir_count = 0
@@ -508,6 +1864,8 @@ def new_chapter( chapter_number = 0 ):
             first_scene_file.write( chapter_notes )
 
     print("* Added new chapter directory: " + "Chapter " + str(chapter_number) + " - " + chapter_name + "")
+    # the new scene files aren't in this run's index yet
+    project_index( refresh = True )
 
 def init_project():
     new_chapter(1)
@@ -534,131 +1892,810 @@ def init_project():
             example_scene_file.write( exampleScene )
 
 
+def export_file( target ):
+    return export_directory + "/" + config["bookFile"] + "." + target
+
+def _hash_file( input_hash, file_path ):
+    if os.path.isfile( file_path ):
+        with open( file_path, 'rb') as input_file:
+            input_hash.update( hashlib.sha1( input_file.read() ).digest() )
+    else:
+        input_hash.update( b"missing" )
+
+def export_inputs_hash():
+    # One hash over everything an export is built from: the scenes (hashes
+    # come from the project index, so unchanged scenes are only stat'ed),
+    # the book's metadata and replacements from config.yml, the cover image
+    # and the pandoc version and options. The rest of config.yml (NaNoWriMo,
+    # graphs, word count offset) doesn't change an export.
+    _set_pandoc_args()
+    input_hash = hashlib.sha1()
+    scenes = project_index().scenes
+    for file_path in manuscript_files():
+        input_hash.update( str.encode( file_path + "\t" + scenes[ file_path ]["sha1"] + "\n" ) )
+    input_hash.update( str.encode( json.dumps( [ config.get( config_key ) for config_key in export_config_keys ], sort_keys=True ) ) )
+    if "coverImage" in config and config["coverImage"] != "":
+        _hash_file( input_hash, config["coverImage"] )
+    input_hash.update( str.encode( pandoc_version + "\n" + pandoc_markdown_arg ) )
+    return input_hash.hexdigest()
+
+def load_build_manifest():
+    if os.path.isfile( build_manifest_file ):
+        try:
+            with open( build_manifest_file, 'r', encoding="utf8") as manifest_file:
+                return json.load( manifest_file )
+        except ValueError:
+            if _debug:
+                print("* Ignoring unreadable build manifest " + build_manifest_file)
+    return {}
+
+def export_build_mode( target ):
+    # the incremental and full epub are built from the same inputs but
+    # aren't the same file, switching modes has to rebuild it
+    if target == "epub":
+        return "incremental" if command_options["incremental"] else "full"
+    return None
+
+def record_exports( targets, inputs_hash ):
+    build_manifest = load_build_manifest()
+    for target in targets:
+        build_manifest[ target ] = {
+            "inputs": inputs_hash,
+            "built": datetime.datetime.now().isoformat(),
+        }
+        if export_build_mode( target ) is not None:
+            build_manifest[ target ]["mode"] = export_build_mode( target )
+    if os.path.isdir(export_directory) == False:
+        os.mkdir( export_directory )
+    built_file = workspace_file( "build-manifest.json" )
+    with open( built_file, 'w', encoding="utf8") as manifest_file:
+        json.dump( build_manifest, manifest_file, indent=1, sort_keys=True )
+    publish_file( built_file, build_manifest_file )
+
+def export_is_current( target, inputs_hash, build_manifest = None ):
+    if command_options["force"] or os.path.isfile( export_file( target ) ) == False:
+        return False
+    if build_manifest is None:
+        build_manifest = load_build_manifest()
+    manifest_entry = build_manifest.get( target, {} )
+    return manifest_entry.get( "inputs" ) == inputs_hash and manifest_entry.get( "mode" ) == export_build_mode( target )
+
+def pandoc_render_args( target, output_file ):
+    # pandoc arguments rendering a target from the manuscript's JSON AST
+    if target == "pdf":
+        return [ "-f", "json", "-V", "fontsize=" + config["pdfFontSize"], "-o", output_file ]
+    if target == "docx":
+        return [ "-f", "json", "-s", "-o", output_file ]
+    return [ "-f", "json", "-o", output_file ]
+
+def manuscript_ast( inputs_hash ):
+    # Parses the metadata and manuscript markdown to pandoc's JSON AST once,
+    # every pandoc export is rendered from it. A copy is kept in Exports/
+    # and reused by later runs until the inputs change, this run renders from
+    # its own so a concurrent build replacing the copy can't change it.
+    built_file = workspace_file( "manuscript-ast.json" )
+    if command_options["force"] == False and os.path.isfile( manuscript_ast_file ) and load_build_manifest().get( "ast", {} ).get( "inputs" ) == inputs_hash:
+        # the run's own link (or copy, across file systems) of the cached AST
+        if os.path.isfile( built_file ):
+            os.remove( built_file )
+        try:
+            os.link( manuscript_ast_file, built_file )
+        except OSError:
+            shutil.copyfile( manuscript_ast_file, built_file )
+        return built_file
+    _set_pandoc_args()
+    started = time.perf_counter()
+    return_code = pandoc_from_manuscript( pandoc_markdown_arg.split() + [ "-t", "json", "-o", built_file ] )
+    record_timing( "pandoc ast", started )
+    if return_code != 0:
+        print("ERROR: pandoc couldn't parse the manuscript")
+        return None
+    publish_file( built_file, manuscript_ast_file, keep_built_file = True )
+    record_exports( [ "ast" ], inputs_hash )
+    return built_file
+
+def chapter_title( chapter_text, chapter_name ):
+    # The chapter's first markdown heading, or its directory name
+    for line in chapter_text.splitlines():
+        if line.startswith("#"):
+            return line.strip("# \t")
+    return chapter_name
+
+def xml_numeric_entities( fragment ):
+    # pandoc's HTML can use named entities like &nbsp; which aren't defined in
+    # the XHTML an epub holds, swap them for numeric ones
+    from html.entities import name2codepoint
+    def numeric_entity( match ):
+        if match.group(1) in ( "amp", "lt", "gt", "quot", "apos" ) or match.group(1) not in name2codepoint:
+            return match.group(0)
+        return "&#" + str( name2codepoint[ match.group(1) ] ) + ";"
+    return re.sub( r"&([A-Za-z][A-Za-z0-9]*);", numeric_entity, fragment )
+
+def render_chapter_xhtml( chapter_text, cache_file, cancel_event = None ):
+    # Renders one chapter's markdown to an XHTML fragment in the chapter cache
+    if cancel_event is not None and cancel_event.is_set():
+        return 1
+    started = time.perf_counter()
+    pandoc = subprocess.run( ["pandoc"] + pandoc_markdown_arg.split() + [ "-t", "html5" ], input=chapter_text.encode("utf8"), stdout=subprocess.PIPE )
+    record_timing( "pandoc epub chapter", started )
+    if pandoc.returncode != 0:
+        return pandoc.returncode
+    built_file = workspace_file( os.path.basename( cache_file ) )
+    with open( built_file, 'w', encoding="utf8") as xhtml_file:
+        xhtml_file.write( xml_numeric_entities( pandoc.stdout.decode("utf8") ) )
+    publish_file( built_file, cache_file )
+    return 0
+
+def xhtml_document( title, body ):
+    from html import escape
+    return ( '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        + '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="' + escape( config["languageCode"] ) + '" lang="' + escape( config["languageCode"] ) + '">\n'
+        + '<head>\n<meta charset="UTF-8" />\n<title>' + escape( title ) + '</title>\n<link rel="stylesheet" type="text/css" href="stylesheet.css" />\n</head>\n'
+        + '<body>\n' + body + '\n</body>\n</html>\n' )
+
+def write_epub_container( epub_path, chapters ):
+    # Zips the epub from the cached chapter XHTML. chapters is a list of
+    # (title, cache file), the mimetype entry goes first and uncompressed.
+    # Only the chapter renders are cached, the container (package document,
+    # navigation, title page, cover) is rebuilt in full every time.
+    import zipfile
+    import uuid
+    import mimetypes
+    from html import escape
+
+    book_id = "urn:uuid:" + str( uuid.uuid5( uuid.NAMESPACE_URL, config["bookName"] + "\n" + config["authorName"] ) )
+    modified = datetime.datetime.now( datetime.timezone.utc ).strftime("%Y-%m-%dT%H:%M:%SZ")
+    cover_image = config.get("coverImage") or ""
+    if cover_image and os.path.isfile( cover_image ) == False:
+        print("Warning cover image '" + cover_image + "' not found")
+        cover_image = ""
+
+    manifest_items = [
+        '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav" />',
+        '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml" />',
+        '<item id="stylesheet" href="stylesheet.css" media-type="text/css" />',
+        '<item id="title-page" href="title-page.xhtml" media-type="application/xhtml+xml" />',
+    ]
+    spine_items = [ '<itemref idref="title-page" />' ]
+    cover_meta = ""
+    if cover_image:
+        cover_href = "cover" + os.path.splitext( cover_image )[1].lower()
+        cover_type = mimetypes.guess_type( cover_image )[0] or "image/jpeg"
+        manifest_items.insert( 0, '<item id="cover-page" href="cover.xhtml" media-type="application/xhtml+xml" />' )
+        manifest_items.insert( 0, '<item id="cover-image" href="' + cover_href + '" media-type="' + cover_type + '" properties="cover-image" />' )
+        spine_items.insert( 0, '<itemref idref="cover-page" linear="no" />' )
+        cover_meta = '<meta name="cover" content="cover-image" />\n'
+
+    nav_points = []
+    nav_items = []
+    for chapter_number, ( title, cache_file ) in enumerate( chapters, start=1 ):
+        chapter_id = "chapter-%03d" % chapter_number
+        manifest_items.append( '<item id="' + chapter_id + '" href="' + chapter_id + '.xhtml" media-type="application/xhtml+xml" />' )
+        spine_items.append( '<itemref idref="' + chapter_id + '" />' )
+        nav_items.append( '<li><a href="' + chapter_id + '.xhtml">' + escape( title ) + '</a></li>' )
+        nav_points.append( '<navPoint id="nav-' + chapter_id + '" playOrder="' + str( chapter_number ) + '"><navLabel><text>' + escape( title ) + '</text></navLabel><content src="' + chapter_id + '.xhtml" /></navPoint>' )
+
+    package_document = ( '<?xml version="1.0" encoding="UTF-8"?>\n'
+        + '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id" xml:lang="' + escape( config["languageCode"] ) + '">\n'
+        + '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+        + '<dc:identifier id="book-id">' + book_id + '</dc:identifier>\n'
+        + '<dc:title>' + escape( config["bookName"] ) + '</dc:title>\n'
+        + '<dc:creator>' + escape( config["authorName"] ) + '</dc:creator>\n'
+        + '<dc:language>' + escape( config["languageCode"] ) + '</dc:language>\n'
+        + '<dc:rights>' + escape( config["copyRight"] ) + '</dc:rights>\n'
+        + '<dc:publisher>' + escape( config["publisherName"] ) + '</dc:publisher>\n'
+        + '<meta property="dcterms:modified">' + modified + '</meta>\n'
+        + cover_meta
+        + '</metadata>\n<manifest>\n' + "\n".join( manifest_items ) + '\n</manifest>\n'
+        + '<spine toc="ncx">\n' + "\n".join( spine_items ) + '\n</spine>\n</package>\n' )
+    navigation = xhtml_document( config["bookName"], '<nav epub:type="toc" id="toc">\n<ol>\n' + "\n".join( nav_items ) + '\n</ol>\n</nav>' )
+    ncx = ( '<?xml version="1.0" encoding="UTF-8"?>\n<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+        + '<head><meta name="dtb:uid" content="' + book_id + '" /></head>\n'
+        + '<docTitle><text>' + escape( config["bookName"] ) + '</text></docTitle>\n'
+        + '<navMap>\n' + "\n".join( nav_points ) + '\n</navMap>\n</ncx>\n' )
+    title_page = xhtml_document( config["bookName"], '<section epub:type="titlepage" class="titlepage">\n<h1 class="title">' + escape( config["bookName"] ) + '</h1>\n<p class="author">' + escape( config["authorName"] ) + '</p>\n<p class="rights">' + escape( config["copyRight"] ) + '</p>\n</section>' )
+    stylesheet = "body { margin: 5%; text-align: justify; }\nh1, h2, h3 { text-align: left; }\n.titlepage { text-align: center; }\nhr { margin: 1em auto; width: 20%; }\n"
+
+    built_file = workspace_file( os.path.basename( epub_path ) )
+    with zipfile.ZipFile( built_file, 'w', zipfile.ZIP_DEFLATED ) as epub:
+        epub.writestr( zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED )
+        epub.writestr( "META-INF/container.xml", '<?xml version="1.0" encoding="UTF-8"?>\n<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n<rootfiles>\n<rootfile full-path="EPUB/content.opf" media-type="application/oebps-package+xml" />\n</rootfiles>\n</container>\n' )
+        epub.writestr( "EPUB/content.opf", package_document )
+        epub.writestr( "EPUB/nav.xhtml", navigation )
+        epub.writestr( "EPUB/toc.ncx", ncx )
+        epub.writestr( "EPUB/stylesheet.css", stylesheet )
+        epub.writestr( "EPUB/title-page.xhtml", title_page )
+        if cover_image:
+            epub.write( cover_image, "EPUB/" + cover_href, compress_type=zipfile.ZIP_STORED )
+            epub.writestr( "EPUB/cover.xhtml", xhtml_document( config["bookName"], '<section epub:type="cover"><img src="' + cover_href + '" alt="cover image" /></section>' ) )
+        for chapter_number, ( title, cache_file ) in enumerate( chapters, start=1 ):
+            with open( cache_file, 'r', encoding="utf8") as xhtml_file:
+                epub.writestr( "EPUB/chapter-%03d.xhtml" % chapter_number, xhtml_document( title, xhtml_file.read() ) )
+    publish_file( built_file, epub_path )
+
+def create_incremental_epub( cancel_event = None ):
+    # Renders each chapter directory to its own XHTML document, cached in
+    # Exports/.epub-chapters by a hash of its markdown and the pandoc version,
+    # so only chapters that changed since the last build go through pandoc.
+    # The container around them is re-zipped, which takes milliseconds.
+    from concurrent.futures import ThreadPoolExecutor
+    _set_pandoc_args()
+    if os.path.isdir( epub_chapter_cache_directory ) == False:
+        os.makedirs( epub_chapter_cache_directory )
+
+    chapters = []
+    stale_chapters = []
+    stale_cache_files = set()
+    manuscript = manuscript_chapters()
+    scene_texts = read_scenes( [ file_path for root, scene_files in manuscript for file_path in scene_files ] )
+    for root, scene_files in manuscript:
+        chapter_text = "".join( chapter_chunks( scene_texts, len( scene_files ) ) )
+        chapter_hash = hashlib.sha1( str.encode( pandoc_version + "\t" + pandoc_markdown_arg + "\n" + chapter_text ) ).hexdigest()
+        cache_file = epub_chapter_cache_directory + "/" + chapter_hash + ".xhtml"
+        chapters.append( ( chapter_title( chapter_text, os.path.basename( root ) ), cache_file ) )
+        if ( command_options["force"] or os.path.isfile( cache_file ) == False ) and cache_file not in stale_cache_files:
+            # chapters with identical text share a cache file, it's rendered once
+            stale_cache_files.add( cache_file )
+            stale_chapters.append( ( chapter_text, cache_file ) )
+
+    if stale_chapters:
+        with ThreadPoolExecutor( max_workers = max( 1, command_options["jobs"] ) ) as render_pool:
+            return_codes = list( render_pool.map( lambda chapter: render_chapter_xhtml( *chapter, cancel_event ), stale_chapters ) )
+        if cancel_event is not None and cancel_event.is_set():
+            return 1
+        if any( return_codes ):
+            print("ERROR: pandoc couldn't render " + str( sum( 1 for return_code in return_codes if return_code ) ) + " chapter(s)")
+            return max( return_codes )
+
+    write_epub_container( export_file( "epub" ), chapters )
+
+    # drop cached renders of chapter versions that are no longer in the book
+    current_files = set( os.path.basename( cache_file ) for title, cache_file in chapters )
+    for cache_entry in os.scandir( epub_chapter_cache_directory ):
+        if cache_entry.name not in current_files:
+            os.remove( cache_entry.path )
+    print("* Rendered " + str( len( stale_chapters ) ) + " of " + str( len( chapters ) ) + " epub chapters")
+    return 0
+
+def needs_manuscript_ast( target ):
+    # md and txt are streamed, mobi converted from the epub and the
+    # incremental epub renders chapter by chapter
+    if target == "epub":
+        return command_options["incremental"] == False
+    return target not in native_export_writers and target != "mobi"
+
 def create_epub():
     global recreate_epub_and_temp_files
     #Requires SYSCALL to pandoc
-    if os.path.isfile('./" + export_directory + "/" + config["bookFile"] + ".epub') == False and recreate_epub_and_temp_files == True:
-        create_book_metadata()
-        pre_process( writeFile = True )
-
-        os.system("pandoc " + pandoc_markdown_arg + " -o \"" + export_directory + "/" + config["bookFile"] + ".epub\" \"00-ebook-info.txt\" \"temp_work_file.md\"")
-
+    if recreate_epub_and_temp_files == True:
+        create_pandoc_export( "epub" )
         recreate_epub_and_temp_files = False
-        print("* " + export_directory + "/" + config["bookFile"] + ".epub created")
+
+def create_pandoc_export( target ):
+    inputs_hash = export_inputs_hash()
+    if export_is_current( target, inputs_hash ):
+        print("* " + export_file( target ) + " is up to date")
+        return True
+    ast_file = None
+    if needs_manuscript_ast( target ):
+        ast_file = manuscript_ast( inputs_hash )
+        if ast_file is None:
+            print("ERROR: " + export_file( target ) + " failed")
+            return False
+    if run_export( target, ast_file )[0] != 0:
+        print("ERROR: " + export_file( target ) + " failed")
+        return False
+    record_exports( [ target ], inputs_hash )
+    print("* " + export_file( target ) + " created")
+    return True
+
+def create_epub_conversion( target ):
+    # mobi is converted from the epub rather than the manuscript
+    create_epub()
+    inputs_hash = export_inputs_hash()
+    if export_is_current( target, inputs_hash ):
+        print("* " + export_file( target ) + " is up to date")
+        return True
+    return_code, seconds = run_export( target, None )
+    if return_code != 0:
+        print("ERROR: " + export_file( target ) + " failed")
+        return False
+    record_exports( [ target ], inputs_hash )
+    print("* " + export_file( target ) + " created")
+    return True
 
 def create_txt():
-    #Requires SYSCALL to pandoc
-    os.system("pandoc -t plain \"" + export_directory + "/" + config["bookFile"] + ".epub\" -o \"" + export_directory + "/" + config["bookFile"] + ".txt\"")
-    print("* " + export_directory + "/" + config["bookFile"] + ".txt created")
+    create_native_export( "txt" )
 
 def create_html():
     #Requires SYSCALL to pandoc
-    create_book_metadata()
-    pre_process( writeFile = True )
-
-    os.system("pandoc " + pandoc_markdown_arg + " -o \"" + export_directory + "/" + config["bookFile"] + ".html\" \"00-ebook-info.txt\" \"temp_work_file.md\"")
-
-    print("* " + export_directory + "/" + config["bookFile"] + ".html created")
+    create_pandoc_export( "html" )
 
 
 def create_mobi():
     #Requires SYSCALL to pandoc
     #Requires SYSCALL to calibre tools
-    create_epub()
-    os.system("ebook-convert \"" + export_directory + "/" + config["bookFile"] + ".epub\" \"" + export_directory + "/" + config["bookFile"] + ".mobi\" > \"" + config["bookFile"] + ".convert.log\"")
-    print("* " + export_directory + "/" + config["bookFile"] + ".mobi created")
-    if os.path.isfile( config["bookFile"] + ".convert.log" ):
-        os.remove( config["bookFile"] + ".convert.log" )
+    create_epub_conversion( "mobi" )
 
 def create_md():
-    global recreate_epub_and_temp_files
-    #Requires SYSCALL to pandoc
-    if os.path.isfile('./" + export_directory + "/" + config["bookFile"] + ".epub') == False and recreate_epub_and_temp_files == True:
-        create_book_metadata()
-        pre_process( writeFile = True )
-        copyfile( "./temp_work_file.md", export_directory + "/" + config["bookFile"] + ".md" )
-        print("* " + export_directory + "/" + config["bookFile"] + ".md created")
-        recreate_epub_and_temp_files = False
+    create_native_export( "md" )
+
+def create_native_export( target ):
+    # md and txt are written by this script, pandoc isn't needed for them
+    inputs_hash = export_inputs_hash()
+    if export_is_current( target, inputs_hash ):
+        print("* " + export_file( target ) + " is up to date")
+        return
+    if os.path.isdir(export_directory) == False:
+        os.mkdir( export_directory )
+    run_export( target, None )
+    if build_results[ target ][0] != 0:
+        print("ERROR: " + export_file( target ) + " failed")
+        return
+    record_exports( [ target ], inputs_hash )
+    print("* " + export_file( target ) + " created")
 
 
 def create_pdf():
     #Requires SYSCALL to pandoc
-    create_book_metadata()
-    pre_process( writeFile = True )
-
-    os.system("pandoc -V fontsize=" + config["pdfFontSize"] + " " + pandoc_markdown_arg + " -o \"" + export_directory + "/" + config["bookFile"] + ".pdf\" \"00-ebook-info.txt\" \"temp_work_file.md\"")
-    # print("pandoc -V fontsize=" + config["pdfFontSize"] + " " + pandoc_markdown_arg + " -o \"" + export_directory + "/" + config["bookFile"] + ".pdf\" \"00-ebook-info.txt\" \"temp_work_file.md\"")
-    print("* " + export_directory + "/" + config["bookFile"] + ".pdf created")
+    create_pandoc_export( "pdf" )
 
 
 def create_doc():
     #Requires SYSCALL to pandoc
-    create_book_metadata()
-    pre_process( writeFile = True )
-    os.system("pandoc " + pandoc_markdown_arg + " -o \"" + export_directory + "/" + config["bookFile"] + ".doc\" \"00-ebook-info.txt\" \"temp_work_file.md\"")
-    print("* " + export_directory + "/" + config["bookFile"] + ".doc created")
+    create_pandoc_export( "doc" )
 
 
 def create_docx():
     #Requires SYSCALL to pandoc
-    create_book_metadata()
-    pre_process( writeFile = True )
-    os.system("pandoc -s -o \"" + export_directory + "/" + config["bookFile"] + ".docx\" \"00-ebook-info.txt\" \"temp_work_file.md\"")
-
-    print("* " + export_directory + "/" + config["bookFile"] + ".docx created")
+    create_pandoc_export( "docx" )
 
 
 def create_odt():
     #Requires SYSCALL to pandoc
-    create_book_metadata()
-    pre_process( writeFile = True )
-
-    os.system("pandoc " + pandoc_markdown_arg + " -o \"" + export_directory + "/" + config["bookFile"] + ".odt\" \"00-ebook-info.txt\" \"temp_work_file.md\"")
-    print("* " + export_directory + "/" + config["bookFile"] + ".odt created")
+    create_pandoc_export( "odt" )
+
+
+def run_converter( converter_args, cancel_event = None, **popen_args ):
+    # subprocess.call() that terminates the converter if cancel_event is set
+    converter = subprocess.Popen( converter_args, **popen_args )
+    while True:
+        try:
+            return converter.wait( timeout = None if cancel_event is None else 0.1 )
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set():
+                converter.terminate()
+                return converter.wait()
+
+def run_export( target, ast_file, cancel_event = None ):
+    # Builds one target from the manuscript's AST, returns (exit code, seconds)
+    started = time.perf_counter()
+    try:
+        if target in native_export_writers:
+            phase = "write " + target
+            native_export_writers[ target ]()
+            return_code = 0
+        elif target == "epub" and command_options["incremental"]:
+            phase = "incremental epub"
+            return_code = create_incremental_epub( cancel_event )
+        else:
+            # converters write into the workspace and a finished export is
+            # moved into Exports/, a failed or cancelled one never is
+            built_file = workspace_file( os.path.basename( export_file( target ) ) )
+            if target == "mobi":
+                phase = "ebook-convert mobi"
+                return_code = run_converter( [ "ebook-convert", export_file( "epub" ), built_file ], cancel_event, stdout=subprocess.DEVNULL )
+            else:
+                phase = "pandoc " + target
+                return_code = run_converter( ["pandoc"] + pandoc_render_args( target, built_file ) + [ ast_file ], cancel_event )
+            if return_code == 0:
+                publish_file( built_file, export_file( target ) )
+    except OSError as error:
+        # most likely pandoc or calibre isn't installed
+        print("ERROR: " + str( error ) )
+        return_code = 127
+    record_timing( phase, started )
+    seconds = time.perf_counter() - started
+    with phase_timings_lock:
+        build_results[ target ] = ( return_code, seconds )
+    return return_code, seconds
+
+def build_exports( targets, jobs = None, cancel_event = None ):
+    # Parses the manuscript once, then renders the independent pandoc and
+    # calibre conversions side by side, at most `jobs` at a time. Setting
+    # cancel_event stops the build, running conversions are terminated.
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    global recreate_epub_and_temp_files
 
+    if jobs is None:
+        jobs = command_options["jobs"]
+    build_started = time.perf_counter()
+
+    build_order = []
+    for target in targets:
+        for needed_target in export_dependencies.get( target, [] ) + [ target ]:
+            if needed_target not in build_order:
+                build_order.append( needed_target )
+
+    finished_targets = set()
+    failed_targets = set()
+    built_targets = []
+    if recreate_epub_and_temp_files == False:
+        # already built earlier in this run
+        finished_targets.add( "epub" )
+
+    inputs_hash = export_inputs_hash()
+    build_manifest = load_build_manifest()
+    for target in build_order:
+        if target in finished_targets:
+            continue
+        # anything converted from a target that's being rebuilt is stale too
+        rebuilding_dependency = any( dependency in build_order and dependency not in finished_targets for dependency in export_dependencies.get( target, [] ) )
+        if rebuilding_dependency == False and export_is_current( target, inputs_hash, build_manifest ):
+            print("* " + export_file( target ) + " is up to date")
+            finished_targets.add( target )
+
+    if all( target in finished_targets for target in build_order ):
+        print("* All exports are up to date (use --force to rebuild)")
+        return True
+
+    pending_targets = [ target for target in build_order if target not in finished_targets ]
+    ast_file = None
+    if any( needs_manuscript_ast( target ) for target in pending_targets ):
+        ast_file = manuscript_ast( inputs_hash )
+        if ast_file is None:
+            # the exports written without pandoc are still built
+            for target in list( pending_targets ):
+                if needs_manuscript_ast( target ):
+                    print("ERROR: Skipping " + export_file( target ) + " because pandoc couldn't parse the manuscript")
+                    failed_targets.add( target )
+                    pending_targets.remove( target )
+    if os.path.isdir(export_directory) == False:
+        os.mkdir( export_directory )
+    running_targets = {}
+    cancelled_targets = []
+    with ThreadPoolExecutor( max_workers = max( 1, jobs ) ) as build_pool:
+        while pending_targets or running_targets:
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled_targets.extend( pending_targets )
+                del pending_targets[:]
+            for target in list( pending_targets ):
+                dependencies = export_dependencies.get( target, [] )
+                if any( dependency in failed_targets for dependency in dependencies ):
+                    print("ERROR: Skipping " + export_file( target ) + " because " + ", ".join( dependencies ) + " failed")
+                    failed_targets.add( target )
+                    pending_targets.remove( target )
+                elif all( dependency in finished_targets for dependency in dependencies ):
+                    running_targets[ build_pool.submit( run_export, target, ast_file, cancel_event ) ] = target
+                    pending_targets.remove( target )
+
+            if not running_targets:
+                break
+            done_builds, remaining_builds = wait( running_targets, return_when=FIRST_COMPLETED )
+            for build in done_builds:
+                target = running_targets.pop( build )
+                return_code, seconds = build.result()
+                if return_code == 0:
+                    finished_targets.add( target )
+                    built_targets.append( target )
+                    print("* " + export_file( target ) + " created (" + "%.2f" % seconds + "s)")
+                elif cancel_event is not None and cancel_event.is_set():
+                    cancelled_targets.append( target )
+                else:
+                    failed_targets.add( target )
+                    print("ERROR: " + export_file( target ) + " failed with exit code " + str( return_code ) + " (" + "%.2f" % seconds + "s)")
+
+    if "epub" in finished_targets:
+        recreate_epub_and_temp_files = False
+    if built_targets:
+        record_exports( built_targets, inputs_hash )
+    if cancelled_targets:
+        print("* Build cancelled, " + ", ".join( cancelled_targets ) + " not built")
+        return False
 
-def word_count():
-    manuscript_data = pre_process()
-    manuscript_data = normalize_markdown( manuscript_data )
+    print("* Built " + str( len( built_targets ) ) + " of " + str( len( build_order ) ) + " exports in " + "%.2f" % ( time.perf_counter() - build_started ) + "s using up to " + str( jobs ) + " jobs")
+    return not failed_targets
 
 
-    word_count =  len(manuscript_data.split()) - config["wordCountOffset"]
+def word_count():
+    word_count = manuscript_word_count() - config["wordCountOffset"]
     print("    Project Wordcount: " + str(word_count) )
     print("     Today's Progress: " + str(todays_progress ) )
     return word_count
 
 
 def chapter_word_count():
-    chapter_data = pre_process_chapters()
+    chapter_counts = project_index().chapter_word_counts()
     print("  -------------- Chapter Word Counts -----------------" )
     rpad_length = 0
-    for chapter in chapter_data.keys():
+    for chapter in chapter_counts.keys():
         if len(chapter) > rpad_length:
             rpad_length = len(chapter)
-    for chapter in chapter_data.keys():
-        print( chapter.rjust(rpad_length) + ': ' + str( len(chapter_data[chapter].split()) ) )
-
-
-if len(sys.argv) > 1:
-    for arg in sys.argv:
+    for chapter in chapter_counts.keys():
+        print( chapter.rjust(rpad_length) + ': ' + str( chapter_counts[chapter] ) )
+
+
+def project_stats():
+    # Words, characters, paragraphs and words changed since the last save
+    # for every scene, chapter and the whole manuscript, all from the project
+    # index (so only scenes edited since the last scan are read)
+    scene_index = project_index()
+    saved_scene_words = load_saved_scene_words()
+    count_names = ( "words", "characters", "paragraphs", "changed" )
+    totals = dict( ( count_name, 0 ) for count_name in count_names )
+    chapters = []
+    for chapter_directory, scene_files in scene_index.chapters():
+        chapter = dict( chapter = os.path.basename( chapter_directory ), path = chapter_directory, scenes = [] )
+        chapter.update( ( count_name, 0 ) for count_name in count_names )
+        for file_path in scene_files:
+            index_entry = scene_index.scenes[ file_path ]
+            scene = dict(
+                scene = os.path.basename( file_path ),
+                path = file_path,
+                words = index_entry["words"],
+                characters = index_entry["characters"],
+                paragraphs = index_entry["paragraphs"],
+                changed = index_entry["words"] - saved_scene_words.get( file_path, 0 ),
+            )
+            for count_name in count_names:
+                chapter[ count_name ] += scene[ count_name ]
+            chapter["scenes"].append( scene )
+        chapters.append( chapter )
+
+    # scenes deleted since the last save count against their chapter
+    chapters_by_path = dict( ( chapter["path"], chapter ) for chapter in chapters )
+    for file_path, saved_words in saved_scene_words.items():
+        if file_path not in scene_index.scenes:
+            if os.path.dirname( file_path ) in chapters_by_path:
+                chapters_by_path[ os.path.dirname( file_path ) ]["changed"] -= saved_words
+            else:
+                # the whole chapter is gone
+                totals["changed"] -= saved_words
+
+    for chapter in chapters:
+        for count_name in count_names:
+            totals[ count_name ] += chapter[ count_name ]
+    totals["project_words"] = totals["words"] - config["wordCountOffset"]
+    totals["chapters"] = chapters
+    return totals
+
+def stats():
+    manuscript_stats = project_stats()
+    count_names = ( "words", "characters", "paragraphs", "changed" )
+    if command_options["output_format"] == "json":
+        json.dump( manuscript_stats, sys.stdout, indent=1 )
+        print("")
+        return
+    if command_options["output_format"] == "csv":
+        import csv
+        stats_writer = csv.writer( sys.stdout, lineterminator="\n" )
+        stats_writer.writerow( ( "level", "chapter", "scene" ) + count_names )
+        for chapter in manuscript_stats["chapters"]:
+            for scene in chapter["scenes"]:
+                stats_writer.writerow( ( "scene", chapter["chapter"], scene["scene"] ) + tuple( scene[ count_name ] for count_name in count_names ) )
+            stats_writer.writerow( ( "chapter", chapter["chapter"], "" ) + tuple( chapter[ count_name ] for count_name in count_names ) )
+        stats_writer.writerow( ( "total", "", "" ) + tuple( manuscript_stats[ count_name ] for count_name in count_names ) )
+        return
+
+    name_length = max( [ len( "Manuscript" ) ] + [ len( chapter["chapter"] ) for chapter in manuscript_stats["chapters"] ] + [ len( scene["scene"] ) + 4 for chapter in manuscript_stats["chapters"] for scene in chapter["scenes"] ] )
+    def stats_row( name, counts ):
+        return "  " + name.ljust( name_length ) + str( counts["words"] ).rjust(9) + str( counts["characters"] ).rjust(12) + str( counts["paragraphs"] ).rjust(12) + ( "%+d" % counts["changed"] ).rjust(9)
+    print( "  " + "".ljust( name_length ) + "Words".rjust(9) + "Characters".rjust(12) + "Paragraphs".rjust(12) + "Changed".rjust(9) )
+    for chapter in manuscript_stats["chapters"]:
+        print( stats_row( chapter["chapter"], chapter ) )
+        for scene in chapter["scenes"]:
+            print( stats_row( "    " + scene["scene"], scene ) )
+    print( stats_row( "Manuscript", manuscript_stats ) )
+    print( "  (changed is since the last save, the project word count is " + str( manuscript_stats["project_words"] ) + ")" )
+
+def record_timing( phase, started ):
+    # Adds the time since `started` (a time.perf_counter()) to a phase of
+    # the --timings breakdown. Exports run side by side, hence the lock.
+    if command_options["timings"] or command_options["timing_log"]:
+        seconds = time.perf_counter() - started
+        with phase_timings_lock:
+            phase_timing = phase_timings.setdefault( phase, [ 0.0, 0 ] )
+            phase_timing[0] += seconds
+            phase_timing[1] += 1
+
+def report_timings( commands, run_seconds ):
+    if command_options["timings"]:
+        print("* Timings for " + " ".join( commands ) + " (" + "%.3f" % run_seconds + "s in all; scan includes reading and counting changed scenes, exports overlap when run side by side)")
+        for phase, ( seconds, calls ) in phase_timings.items():
+            print( "    " + phase.ljust(34) + ( "%.3f" % seconds ).rjust(8) + "s" + str( calls ).rjust(8) + ( " call" if calls == 1 else " calls" ) )
+    if command_options["timing_log"]:
+        if os.path.isdir( progress_directory ) == False:
+            os.mkdir( progress_directory )
+        with open( timing_log_file, 'a', encoding="utf8") as log_file:
+            log_file.write( json.dumps( dict(
+                recorded = datetime.datetime.now().isoformat(),
+                version = __version__,
+                commands = commands,
+                seconds = run_seconds,
+                phases = dict( ( phase, dict( seconds = seconds, calls = calls ) ) for phase, ( seconds, calls ) in phase_timings.items() ),
+            ), sort_keys=True ) + "\n" )
+
+def run_profiled( commands ):
+    # Runs the commands under cProfile, saves the stats for pstats/snakeviz
+    # and prints the slowest calls. Only the main thread is profiled, the
+    # --timings breakdown covers the exports run in the build pool.
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall( run_commands, commands )
+    finally:
+        profiler.dump_stats( command_options["profile"] )
+        print("* Wrote profile to " + command_options["profile"] + " (python -m pstats " + command_options["profile"] + ")")
+        pstats.Stats( profiler ).sort_stats( "cumulative" ).print_stats( 15 )
+
+def parse_options( arguments ):
+    # Pulls the --option flags out of the argument list, returning the commands
+    commands = []
+    arguments = list( arguments )
+    while arguments:
+        arg = arguments.pop(0)
+        if not arg.startswith("--"):
+            commands.append( arg )
+            continue
+        option_name, has_value, option_value = arg[2:].partition("=")
+        if option_name == "jobs":
+            if not has_value and arguments:
+                option_value = arguments.pop(0)
+            try:
+                command_options["jobs"] = max( 1, int( option_value ) )
+            except ValueError:
+                print("Warning --jobs needs a number, got '" + option_value + "'")
+        elif option_name == "force":
+            command_options["force"] = True
+        elif option_name == "incremental":
+            command_options["incremental"] = True
+        elif option_name == "days":
+            if not has_value and arguments:
+                option_value = arguments.pop(0)
+            try:
+                command_options[ option_name ] = max( 1, int( option_value ) )
+            except ValueError:
+                print("Warning --" + option_name + " needs a number, got '" + option_value + "'")
+        elif option_name == "build":
+            if not has_value and arguments:
+                option_value = arguments.pop(0)
+            command_options["build"] = []
+            for target in option_value.split(","):
+                target = target.strip().lower()
+                if target in all_export_targets:
+                    command_options["build"].append( target )
+                elif target:
+                    print("Warning --build can't build '" + target + "', choose from " + ", ".join( all_export_targets ) )
+        elif option_name == "timings":
+            command_options["timings"] = True
+        elif option_name == "timing-log":
+            command_options["timing_log"] = True
+        elif option_name == "profile":
+            if not has_value:
+                option_value = progress_directory + "/profile-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".prof"
+            command_options["profile"] = option_value
+        elif option_name == "run":
+            if not has_value and arguments:
+                option_value = arguments.pop(0)
+            command_options["run"] = [ project_command.strip() for project_command in option_value.split(",") if project_command.strip() not in ( "", "batch" ) ]
+        elif option_name in ( "json", "csv" ):
+            command_options["output_format"] = option_name
+        elif option_name == "results":
+            if not has_value and arguments:
+                option_value = arguments.pop(0)
+            command_options[ option_name ] = option_value
+        else:
+            print("Warning unknown option '" + arg + "'")
+    return commands
+
+def batch_project( project_root, project_commands, jobs ):
+    # Runs the commands in one project, in a batch worker process. Returns
+    # (summary, everything the commands printed).
+    import contextlib
+    started = time.perf_counter()
+    project_output = io.StringIO()
+    summary = dict( project = project_root, words = None, today = None, exports = {}, seconds = 0.0, error = "" )
+    try:
+        os.chdir( project_root )
+        load_config()
+        reset_project_state()
+        command_options["jobs"] = jobs
+        with contextlib.redirect_stdout( project_output ):
+            run_commands( project_commands )
+            remove_temp_files()
+            summary["words"] = manuscript_word_count() - config["wordCountOffset"]
+        if os.path.isfile( progress_database_file ):
+            progress_store = ProgressStore( progress_database_file, read_only = True )
+            try:
+                summary["today"] = progress_store.todays_progress()
+            finally:
+                progress_store.close()
+        summary["exports"] = dict( build_results )
+    except Exception as error:
+        summary["error"] = type( error ).__name__ + ": " + str( error )
+    summary["seconds"] = time.perf_counter() - started
+    return summary, project_output.getvalue()
+
+def batch( project_roots ):
+    # Processes many projects in one go: each runs in its own worker process
+    # (so its config and state stay its own), up to --jobs at once, with the
+    # conversions inside a project sharing what's left of --jobs
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    batch_started = time.perf_counter()
+    roots = []
+    for project_root in project_roots:
+        if os.path.isdir( os.path.join( project_root, manuscript_dir ) ):
+            roots.append( os.path.abspath( project_root ) )
+        else:
+            print("Warning skipping '" + project_root + "', it has no " + manuscript_dir + " folder")
+    if not roots:
+        print("ERROR: No projects to process, usage: enovel-project batch DIR [DIR...]")
+        return False
+
+    processes = min( len( roots ), command_options["jobs"] )
+    project_jobs = max( 1, command_options["jobs"] // processes )
+    summaries = {}
+    with ProcessPoolExecutor( max_workers = processes ) as batch_pool:
+        running_projects = dict( ( batch_pool.submit( batch_project, project_root, command_options["run"], project_jobs ), project_root ) for project_root in roots )
+        for finished_project in as_completed( running_projects ):
+            project_root = running_projects[ finished_project ]
+            try:
+                summary, project_output = finished_project.result()
+            except Exception as error:
+                # the worker process itself died
+                summary, project_output = dict( project = project_root, words = None, today = None, exports = {}, seconds = 0.0, error = type( error ).__name__ + ": " + str( error ) ), ""
+            summaries[ project_root ] = summary
+            print("---------- " + project_root + " ----------------")
+            print( project_output, end="" )
+
+    batch_seconds = time.perf_counter() - batch_started
+    print("* Processed " + str( len( roots ) ) + " projects (" + ", ".join( command_options["run"] ) + ") in " + "%.2f" % batch_seconds + "s using " + str( processes ) + " processes")
+    print( "    " + "Project".ljust(30) + "Words".rjust(10) + "Today".rjust(8) + "Exports".rjust(16) + "Time".rjust(10) )
+    batch_ok = True
+    for project_root in roots:
+        summary = summaries[ project_root ]
+        if summary["error"]:
+            batch_ok = False
+            print( "    " + os.path.basename( project_root ).ljust(30) + "  ERROR: " + summary["error"] )
+            continue
+        failed_exports = [ target for target, ( return_code, seconds ) in summary["exports"].items() if return_code != 0 ]
+        batch_ok = batch_ok and not failed_exports
+        exports = str( len( summary["exports"] ) - len( failed_exports ) ) + " built"
+        if failed_exports:
+            exports += ", " + str( len( failed_exports ) ) + " failed"
+        print( "    " + os.path.basename( project_root ).ljust(30) + str( summary["words"] ).rjust(10) + ( "-" if summary["today"] is None else str( summary["today"] ) ).rjust(8) + exports.rjust(16) + ( "%.2f" % summary["seconds"] + "s" ).rjust(10) )
+        for target in failed_exports:
+            print( "        " + target + " failed with exit code " + str( summary["exports"][ target ][0] ) )
+
+    if command_options["results"]:
+        with open( command_options["results"], 'w', encoding="utf8") as json_file:
+            json.dump( dict(
+                version = __version__,
+                recorded = datetime.datetime.now().isoformat(),
+                commands = command_options["run"],
+                seconds = batch_seconds,
+                projects = [ summaries[ project_root ] for project_root in roots ],
+            ), json_file, indent=1, sort_keys=True )
+        print("* Wrote batch summary to " + command_options["results"])
+    return batch_ok
+
+def run_commands( commands ):
+    if commands[0] == "batch":
+        # the rest of the arguments are project directories
+        if batch( commands[1:] ) == False:
+            sys.exit(1)
+        return
+    for arg in commands:
         if arg == "init":
             init_project()
         elif arg == "all":
             save_progress()
-            create_epub()
-            create_mobi()
-            create_html()
-            create_txt()
-            create_pdf()
-            create_md()
-            # create_doc()
-            create_odt()
-            create_docx()
+            build_exports( all_export_targets )
             word_count()
         elif arg == "ebooks":
             save_progress()
-            create_epub()
-            create_mobi()
+            build_exports( [ "epub", "mobi" ] )
         elif arg == "mobi":
             save_progress()
             create_mobi()
@@ -704,6 +2741,10 @@ if len(sys.argv) > 1:
             save_progress()
             word_count()
             chapter_word_count()
+        elif arg == "stats":
+            stats()
+        elif arg == "history":
+            history()
         elif arg == "nano":
             updateNaNo()
         elif arg == "nc":
@@ -714,13 +2755,24 @@ if len(sys.argv) > 1:
             new_chapter()
         elif arg == "watch":
             watch()
-        elif arg == __file__:
-            # Do Nothing
-            pass
         else:
             print("Warning unknown argument '" + arg + "'");
             print_help()
-    remove_temp_files()
 
-else:
-    print_help()
+compile_normalizer()
+# batch's worker processes may import this script again, they mustn't run it
+if __name__ == "__main__":
+    commands = parse_options( sys.argv[1:] )
+    if len(commands) > 0:
+        run_started = time.perf_counter()
+        if command_options["profile"]:
+            if os.path.isdir( os.path.dirname( command_options["profile"] ) or "." ) == False:
+                os.makedirs( os.path.dirname( command_options["profile"] ) )
+            run_profiled( commands )
+        else:
+            run_commands( commands )
+        remove_temp_files()
+        report_timings( commands, time.perf_counter() - run_started )
+
+    else:
+        print_help()
@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+package_directory = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+script_file = os.path.join( package_directory, "enovel-project.py" )
+
+sys.path.insert( 0, os.path.join( package_directory, "benchmarks" ) )
+from converter_stubs import write_converter_stubs
+
+
+@pytest.fixture
+def enovel( tmp_path, monkeypatch ):
+    # A fresh copy of the script, loaded inside an empty project directory
+    # (it reads, and creates, ./config.yml when it's imported)
+    monkeypatch.chdir( tmp_path )
+    spec = importlib.util.spec_from_file_location( "enovel_project", script_file )
+    module = importlib.util.module_from_spec( spec )
+    # batch's worker processes look the module up by name
+    monkeypatch.setitem( sys.modules, "enovel_project", module )
+    spec.loader.exec_module( module )
+    yield module
+    module.remove_temp_files()
+
+
+@pytest.fixture
+def write_scene( tmp_path ):
+    # write_scene( "Chapter 1/01 - Scene.md", text ) below ./Manuscript
+    def write_scene( scene_path, text ):
+        file_path = tmp_path / "Manuscript" / scene_path
+        file_path.parent.mkdir( parents=True, exist_ok=True )
+        file_path.write_text( text, encoding="utf8" )
+        return "./Manuscript/" + scene_path
+    return write_scene
+
+
+@pytest.fixture
+def converters( enovel, tmp_path, monkeypatch ):
+    # the pandoc and ebook-convert stand-ins from benchmarks/, first on the PATH
+    bin_directory = tmp_path.parent / ( tmp_path.name + "-bin" )
+    write_converter_stubs( str( bin_directory ) )
+    monkeypatch.setenv( "PATH", str( bin_directory ) + os.pathsep + os.environ.get( "PATH", "" ) )
+    return bin_directory
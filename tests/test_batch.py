@@ -0,0 +1,44 @@
+import json
+import os
+
+import yaml
+
+
+def make_project( project_root, scenes ):
+    for scene_path, text in scenes.items():
+        file_path = project_root / "Manuscript" / scene_path
+        file_path.parent.mkdir( parents=True, exist_ok=True )
+        file_path.write_text( text, encoding="utf8" )
+
+
+def test_batch_runs_each_project_in_its_own_process( enovel, tmp_path, converters, capsys ):
+    make_project( tmp_path / "first", { "Chapter 1/01 - Scene.md": "one two three\n" } )
+    make_project( tmp_path / "second", { "Chapter 1/01 - Scene.md": "four five\n", "Chapter 2/01 - Scene.md": "six\n" } )
+    ( tmp_path / "second" / "config.yml" ).write_text( yaml.dump( dict( enovel.default_config, wordCountOffset = 1, bookFile = "Second" ) ), encoding="utf8" )
+    ( tmp_path / "empty" ).mkdir()
+    enovel.command_options.update( jobs = 2, run = [ "wc", "txt" ], results = str( tmp_path / "batch.json" ) )
+
+    assert enovel.batch( [ "first", "second", "empty" ] )
+    output = capsys.readouterr().out
+    assert "Warning skipping 'empty', it has no ./Manuscript folder" in output
+    assert "* Processed 2 projects (wc, txt)" in output
+
+    with open( tmp_path / "batch.json", 'r', encoding="utf8" ) as results_file:
+        projects = json.load( results_file )["projects"]
+    assert [ ( os.path.basename( project["project"] ), project["words"], project["today"], project["error"] ) for project in projects ] == [
+        ( "first", 3, 3, "" ),
+        ( "second", 2, 3, "" ),
+    ]
+    assert projects[0]["exports"]["txt"][0] == 0
+    assert os.path.isfile( tmp_path / "second" / "Exports" / "Second.txt" )
+    # the batch's own directory is left alone
+    assert os.getcwd() == str( tmp_path )
+
+
+def test_batch_reports_a_failed_project( enovel, tmp_path, capsys ):
+    make_project( tmp_path / "broken", { "Chapter 1/01 - Scene.md": "one\n" } )
+    ( tmp_path / "broken" / "config.yml" ).write_text( "replacements: [ not, a, mapping\n", encoding="utf8" )
+    enovel.command_options.update( jobs = 1, run = [ "wc" ] )
+
+    assert enovel.batch( [ "broken" ] ) == False
+    assert "ERROR: " in capsys.readouterr().out
@@ -0,0 +1,121 @@
+import os
+
+
+def book_scenes( write_scene ):
+    write_scene( "Chapter 1 - One/00 - Chapter Header.md", "\\newpage\n\n# Chapter One\n\n" )
+    write_scene( "Chapter 1 - One/01 - Scene.md", "It was a dark and stormy night.\n\nThe rain fell.\n" )
+    write_scene( "Chapter 2 - Two/00 - Chapter Header.md", "\\newpage\n\n# Chapter Two\n\n" )
+    write_scene( "Chapter 2 - Two/01 - Scene.md", "Morning came.\n" )
+
+
+def fail_pandoc_for( converters, extension ):
+    # makes the pandoc stub exit with an error when asked for an .extension
+    stub_file = converters / "pandoc"
+    stub_code = stub_file.read_text( encoding="utf8" )
+    stub_file.write_text( stub_code.replace( "args = sys.argv[1:]\n", "args = sys.argv[1:]\nif '-o' in args and args[ args.index( '-o' ) + 1 ].endswith( '." + extension + "' ):\n    sys.exit( 3 )\n", 1 ), encoding="utf8" )
+
+
+def test_build_exports_builds_every_target( enovel, write_scene, converters ):
+    book_scenes( write_scene )
+    assert enovel.build_exports( enovel.all_export_targets, jobs = 4 )
+    for target in enovel.all_export_targets:
+        assert os.path.isfile( enovel.export_file( target ) ), target
+        assert enovel.build_results[ target ][0] == 0
+    # the stub ebook-convert copies, so the mobi is the finished epub
+    with open( enovel.export_file( "epub" ), 'rb' ) as epub_file, open( enovel.export_file( "mobi" ), 'rb' ) as mobi_file:
+        assert epub_file.read() == mobi_file.read()
+
+
+def test_build_exports_skips_targets_whose_dependency_failed( enovel, write_scene, converters, capsys ):
+    book_scenes( write_scene )
+    fail_pandoc_for( converters, "epub" )
+    assert enovel.build_exports( [ "mobi", "html" ], jobs = 2 ) == False
+    assert "Skipping ./Exports/My Ebook.mobi because epub failed" in capsys.readouterr().out
+    assert enovel.build_results["epub"][0] == 3
+    assert "mobi" not in enovel.build_results
+    assert os.path.isfile( enovel.export_file( "mobi" ) ) == False
+    assert os.path.isfile( enovel.export_file( "html" ) )
+
+
+def test_build_exports_runs_dependencies_first_with_one_job( enovel, write_scene, converters ):
+    book_scenes( write_scene )
+    assert enovel.build_exports( [ "mobi" ], jobs = 1 )
+    assert list( enovel.build_results ) == [ "epub", "mobi" ]
+
+
+def rebuilt_targets( enovel, targets ):
+    enovel.build_results.clear()
+    enovel.recreate_epub_and_temp_files = True
+    enovel.project_index( refresh = True )
+    enovel.build_exports( targets )
+    return sorted( enovel.build_results )
+
+
+def test_unchanged_exports_are_skipped( enovel, write_scene, converters ):
+    book_scenes( write_scene )
+    assert rebuilt_targets( enovel, [ "html", "txt" ] ) == [ "html", "txt" ]
+    assert rebuilt_targets( enovel, [ "html", "txt" ] ) == []
+    enovel.command_options["force"] = True
+    assert rebuilt_targets( enovel, [ "html", "txt" ] ) == [ "html", "txt" ]
+
+
+def test_editing_a_scene_rebuilds( enovel, write_scene, converters ):
+    book_scenes( write_scene )
+    rebuilt_targets( enovel, [ "html" ] )
+    write_scene( "Chapter 2 - Two/01 - Scene.md", "Morning came, and with it the rain.\n" )
+    assert rebuilt_targets( enovel, [ "html" ] ) == [ "html" ]
+
+
+def test_only_build_settings_in_config_rebuild( enovel, write_scene, converters ):
+    book_scenes( write_scene )
+    rebuilt_targets( enovel, [ "html" ] )
+    enovel.config.update( nanoWriMoSecretKey = "secret", wordCountOffset = 100, graphFormat = "svg", sceneReadWorkers = 4 )
+    assert rebuilt_targets( enovel, [ "html" ] ) == []
+    enovel.config["bookName"] = "Another Title"
+    assert rebuilt_targets( enovel, [ "html" ] ) == [ "html" ]
+    enovel.config["replacements"] = { "--": "—" }
+    assert rebuilt_targets( enovel, [ "html" ] ) == [ "html" ]
+
+
+def test_switching_epub_modes_rebuilds( enovel, write_scene, converters ):
+    book_scenes( write_scene )
+    assert rebuilt_targets( enovel, [ "mobi" ] ) == [ "epub", "mobi" ]
+    enovel.command_options["incremental"] = True
+    assert rebuilt_targets( enovel, [ "mobi" ] ) == [ "epub", "mobi" ]
+    assert rebuilt_targets( enovel, [ "mobi" ] ) == []
+    enovel.command_options["incremental"] = False
+    assert rebuilt_targets( enovel, [ "epub" ] ) == [ "epub" ]
+
+
+def test_cached_ast_is_rendered_from_the_runs_own_copy( enovel, write_scene, converters ):
+    book_scenes( write_scene )
+    assert rebuilt_targets( enovel, [ "html" ] ) == [ "html" ]
+    ast_file = enovel.manuscript_ast( enovel.export_inputs_hash() )
+    assert os.path.dirname( ast_file ) == enovel.build_workspace_directory
+    with open( ast_file, 'rb' ) as run_copy, open( enovel.manuscript_ast_file, 'rb' ) as cached_copy:
+        assert run_copy.read() == cached_copy.read()
+    # replacing the cached AST leaves this run's alone
+    os.remove( enovel.manuscript_ast_file )
+    assert os.path.isfile( ast_file )
+
+
+def test_word_count_creates_no_build_workspace( enovel, write_scene ):
+    book_scenes( write_scene )
+    enovel.run_commands( [ "wc" ] )
+    assert os.path.isfile( enovel.project_index_file )
+    assert enovel.build_workspace_directory is None
+    assert [ file_name for file_name in os.listdir( enovel.progress_directory ) if file_name.endswith( ".tmp" ) ] == []
+
+
+def test_all_without_pandoc_still_writes_md_and_txt( enovel, write_scene, tmp_path, monkeypatch, capsys ):
+    book_scenes( write_scene )
+    empty_bin = tmp_path.parent / ( tmp_path.name + "-empty-bin" )
+    empty_bin.mkdir()
+    monkeypatch.setenv( "PATH", str( empty_bin ) )
+    enovel.run_commands( [ "all" ] )
+    output = capsys.readouterr().out
+    assert "Skipping ./Exports/My Ebook.epub because pandoc couldn't parse the manuscript" in output
+    assert "Skipping ./Exports/My Ebook.mobi because epub failed" in output
+    assert sorted( enovel.build_results ) == [ "md", "txt" ]
+    assert os.path.isfile( enovel.export_file( "md" ) ) and os.path.isfile( enovel.export_file( "txt" ) )
+    assert "Project Wordcount: 20" in output
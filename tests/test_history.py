@@ -0,0 +1,59 @@
+import datetime
+import json
+import sqlite3
+
+
+def test_history_by_chapter( enovel, write_scene, capsys ):
+    write_scene( "Chapter 1/01 - Scene.md", "one two three\n" )
+    enovel.save_progress( dont_draw_graphs = True )
+    write_scene( "Chapter 1/01 - Scene.md", "one two\n" )
+    write_scene( "Chapter 2/01 - Scene.md", "three four five six\n" )
+    enovel.project_index( refresh = True )
+    enovel.save_progress( dont_draw_graphs = True )
+
+    today = datetime.date.today().isoformat()
+    assert enovel.chapter_history( 14 ) == [ ( today, "Chapter 1", 2 ), ( today, "Chapter 2", 4 ) ]
+
+    enovel.command_options["output_format"] = "json"
+    enovel.history()
+    assert json.loads( capsys.readouterr().out ) == [
+        dict( day = today, chapter = "Chapter 1", words = 2 ),
+        dict( day = today, chapter = "Chapter 2", words = 4 ),
+    ]
+    enovel.command_options["output_format"] = "table"
+    enovel.history()
+    assert "    Chapter 2: +4" in capsys.readouterr().out
+
+
+def test_renamed_chapter_is_lost_and_written( enovel, tmp_path ):
+    ( tmp_path / "Progress" ).mkdir()
+    yesterday = datetime.datetime.now() - datetime.timedelta( days = 1 )
+    progress_store = enovel.ProgressStore( enovel.progress_database_file )
+    try:
+        progress_store.record( 3, yesterday, scene_words = { "./Manuscript/Chapter 1/01 - Scene.md": 3 } )
+        progress_store.record( 3, scene_words = { "./Manuscript/Chapter One/01 - Scene.md": 3 } )
+    finally:
+        progress_store.close()
+
+    today = datetime.date.today().isoformat()
+    assert enovel.chapter_history( 14 ) == [
+        ( yesterday.date().isoformat(), "Chapter 1", 3 ),
+        ( today, "Chapter 1", -3 ),
+        ( today, "Chapter One", 3 ),
+    ]
+
+
+def test_reports_open_the_store_read_only( enovel, write_scene, tmp_path ):
+    # a store from before scene counts were kept
+    ( tmp_path / "Progress" ).mkdir()
+    connection = sqlite3.connect( enovel.progress_database_file )
+    connection.executescript( "CREATE TABLE snapshots ( recorded_at TEXT NOT NULL, words INTEGER NOT NULL ); CREATE TABLE days ( day TEXT PRIMARY KEY, start_words INTEGER NOT NULL, words INTEGER NOT NULL );" )
+    connection.close()
+    write_scene( "Chapter 1/01 - Scene.md", "one two three\n" )
+
+    assert enovel.chapter_history( 14 ) == []
+    assert enovel.project_stats()["changed"] == 3
+    connection = sqlite3.connect( enovel.progress_database_file )
+    tables = [ table for ( table, ) in connection.execute( "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name" ) ]
+    connection.close()
+    assert tables == [ "days", "snapshots" ]
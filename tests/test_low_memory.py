@@ -0,0 +1,70 @@
+import mmap
+import random
+
+import pytest
+
+# plain scenes, the ones the low memory mode counts straight from the bytes
+plain_texts = [
+    "one",
+    "one two  three\n\nfour\tfive\n",
+    "\n\n  leading and trailing  \n\n",
+    "three\n\n\nblank\n\n\n\nlines\n\n\n\n\n\nhere",
+    "\u3000\u2028ideographic and line separators at the edges\u00a0\u2029",
+    "ünïcödé wörds ñ 😀 emoji😀joined\n\n日本語のテキスト",
+    "a * b\n\n# Heading\n\n-- two dashes aren't a rule",
+]
+
+
+def scene_file( tmp_path, text ):
+    file_path = tmp_path / "scene.md"
+    file_path.write_bytes( text.encode( "utf8" ) )
+    return str( file_path )
+
+
+def text_counts( enovel, text ):
+    normalized_text = enovel.normalize_markdown( text )
+    return enovel.count_words( normalized_text ), len( normalized_text ), enovel.count_paragraphs( normalized_text )
+
+
+@pytest.mark.parametrize( "text", plain_texts )
+@pytest.mark.parametrize( "window", [ 1, 2, 3, 5, 1 << 16 ] )
+def test_mapped_counts_match_the_text_path( enovel, tmp_path, monkeypatch, text, window ):
+    monkeypatch.setattr( enovel, "word_count_window", window )
+    mapped_entry = enovel._mapped_scene_entry( scene_file( tmp_path, text ), None )
+    assert mapped_entry is not None
+    assert mapped_entry[1:] == text_counts( enovel, text )
+
+
+@pytest.mark.parametrize( "text", plain_texts )
+@pytest.mark.parametrize( "window", [ 1, 2, 3, 5, 1 << 16 ] )
+def test_scene_chunks_match_read_scene( enovel, tmp_path, monkeypatch, text, window ):
+    monkeypatch.setattr( enovel, "word_count_window", window )
+    enovel.config["lowMemory"] = True
+    file_path = scene_file( tmp_path, text )
+    assert "".join( enovel.scene_chunks( file_path ) ) == enovel.read_scene( file_path )
+
+
+@pytest.mark.parametrize( "text", [ "", "a\n\n---\n\nb", "windows\r\nline endings", "TK marks a gap" ] )
+def test_scenes_that_need_normalizing_use_the_text_path( enovel, tmp_path, text ):
+    enovel.config["replacements"] = { "TK": "" }
+    enovel.compile_normalizer()
+    enovel.config["lowMemory"] = True
+    file_path = scene_file( tmp_path, text )
+    assert enovel._mapped_scene_entry( file_path, None ) is None
+    assert "".join( enovel.scene_chunks( file_path ) ) == enovel.read_scene( file_path )
+    assert enovel.scene_index_entry( file_path )[0]["words"] == text_counts( enovel, text )[0]
+
+
+def test_mapped_counts_on_random_text( enovel, tmp_path, monkeypatch ):
+    pieces = [ "a", "word", "é", "日本", "😀", " ", "\n", "\n\n", "\n\n\n", "\t", "\u00a0", "\u2028", "\u3000", "*", "-" ]
+    generator = random.Random( 19 )
+    for attempt in range( 500 ):
+        monkeypatch.setattr( enovel, "word_count_window", generator.choice( [ 1, 2, 3, 4, 6, 9, 16 ] ) )
+        text = "".join( generator.choice( pieces ) for piece in range( generator.randrange( 1, 40 ) ) )
+        if "---" in text or text.strip() == "":
+            continue
+        file_path = scene_file( tmp_path, text )
+        assert enovel._mapped_scene_entry( file_path, None )[1:] == text_counts( enovel, text ), repr( text )
+        with open( file_path, 'rb' ) as content_file, mmap.mmap( content_file.fileno(), 0, access=mmap.ACCESS_READ ) as buffer:
+            start, end = enovel._mapped_strip_range( buffer )
+            assert buffer[ start:end ].decode( "utf8" ) == text.strip(), repr( text )
@@ -0,0 +1,161 @@
+import json
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class NaNoStub( BaseHTTPRequestHandler ):
+    # nanowrimo.org's word count API: PUT a count, GET it back as xml. The
+    # first `failures` PUTs answer 503, and a PUT is held until `release` is set.
+    def do_PUT(self):
+        self.server.puts += 1
+        self.server.release.wait()
+        body = self.rfile.read( int( self.headers["Content-Length"] ) ).decode("utf8")
+        if self.server.puts <= self.server.failures:
+            self.send_response( 503 )
+            self.end_headers()
+            return
+        self.server.word_count = int( urllib.parse.parse_qs( body )["wordcount"][0] )
+        self.server.received.append( self.server.word_count )
+        self.send_response( 200 )
+        self.end_headers()
+
+    def do_GET(self):
+        body = ( "<wc><user_wordcount>" + str( self.server.word_count ) + "</user_wordcount></wc>" ).encode("utf8")
+        self.send_response( 200 )
+        self.send_header( "Content-Length", str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def nano_server( enovel, monkeypatch ):
+    server = ThreadingHTTPServer( ( "127.0.0.1", 0 ), NaNoStub )
+    server.puts = 0
+    server.failures = 0
+    server.word_count = 0
+    server.received = []
+    server.release = threading.Event()
+    server.release.set()
+    threading.Thread( target=server.serve_forever, daemon=True ).start()
+    point_nano_at( enovel, monkeypatch, "http://127.0.0.1:" + str( server.server_address[1] ) )
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def point_nano_at( enovel, monkeypatch, base_url ):
+    enovel.config.update( nanoWriMoSecretKey = "secret", nanoWriMoUsername = "writer", nanoWriMoTimeout = 2, nanoWriMoRetries = 2 )
+    monkeypatch.setattr( enovel, "nano_api_url_update_word_count", base_url + "/api/wordcount" )
+    monkeypatch.setattr( enovel, "nano_api_url_current_word_count", base_url + "/wc/writer" )
+    monkeypatch.setattr( enovel, "nano_retry_backoff_seconds", 0.01 )
+
+
+def queued_words( enovel ):
+    with open( enovel.nano_queue_file, 'r', encoding="utf8" ) as queue_file:
+        return json.load( queue_file )["words"]
+
+
+def test_send_retries_with_backoff( enovel, nano_server, monkeypatch ):
+    nano_server.failures = 2
+    sleeps = []
+    real_sleep = time.sleep
+    monkeypatch.setattr( time, "sleep", lambda seconds: sleeps.append( seconds ) or real_sleep( seconds ) )
+
+    nano_sync = enovel.NaNoSync()
+    nano_sync.submit( 1234 )
+    assert nano_sync.flush()
+    nano_sync.close()
+    assert nano_server.puts == 3
+    assert sleeps == [ 0.01, 0.02 ]
+    assert nano_server.received == [ 1234 ]
+    assert os.path.isfile( enovel.nano_queue_file ) == False
+
+
+def test_unreachable_count_is_queued_for_the_next_sync( enovel, nano_server, write_scene, monkeypatch ):
+    # nothing listens on a port that was just released
+    with socket.socket() as closed_socket:
+        closed_socket.bind( ( "127.0.0.1", 0 ) )
+        closed_port = closed_socket.getsockname()[1]
+    nano_url = enovel.nano_api_url_update_word_count.rsplit( "/api/", 1 )[0]
+    point_nano_at( enovel, monkeypatch, "http://127.0.0.1:" + str( closed_port ) )
+
+    nano_sync = enovel.NaNoSync()
+    nano_sync.submit( 1500 )
+    assert nano_sync.flush() == False
+    nano_sync.close()
+    assert queued_words( enovel ) == 1500
+
+    # report commands leave it queued and never touch the network
+    point_nano_at( enovel, monkeypatch, nano_url )
+    write_scene( "Chapter 1/01 - Scene.md", "one two three\n" )
+    enovel.command_options["output_format"] = "json"
+    enovel.run_commands( [ "wc", "stats", "history" ] )
+    assert nano_server.puts == 0
+    assert queued_words( enovel ) == 1500
+
+    # the next sync (watch starts one) sends it without a new count
+    nano_sync = enovel.NaNoSync()
+    assert nano_sync.flush()
+    nano_sync.close()
+    assert nano_server.received == [ 1500 ]
+    assert os.path.isfile( enovel.nano_queue_file ) == False
+
+
+def test_nano_sends_the_current_count_over_a_queued_one( enovel, nano_server, write_scene ):
+    os.mkdir( enovel.progress_directory )
+    with open( enovel.nano_queue_file, 'w', encoding="utf8" ) as queue_file:
+        json.dump( { "words": 1500 }, queue_file )
+    write_scene( "Chapter 1/01 - Scene.md", "one two three\n" )
+    enovel.run_commands( [ "nano" ] )
+    assert nano_server.received[-1] == 3
+    assert os.path.isfile( enovel.nano_queue_file ) == False
+
+
+def test_counts_within_the_interval_go_out_as_one_request( enovel, nano_server ):
+    nano_sync = enovel.NaNoSync( min_interval = 0.5 )
+    nano_sync.submit( 100 )
+    assert nano_sync.flush()
+    first_sent = time.monotonic()
+    for words in ( 200, 300, 400 ):
+        nano_sync.submit( words )
+    assert nano_sync.flush()
+    assert time.monotonic() - first_sent >= 0.5
+    nano_sync.close()
+    assert nano_server.puts == 2
+    assert nano_server.received == [ 100, 400 ]
+
+
+def test_counts_submitted_while_sending_are_merged( enovel, nano_server ):
+    nano_server.release.clear()
+    nano_sync = enovel.NaNoSync()
+    nano_sync.submit( 100 )
+    while nano_server.puts == 0:
+        time.sleep( 0.01 )
+    # the request for 100 is in flight
+    nano_sync.submit( 200 )
+    nano_sync.submit( 300 )
+    nano_server.release.set()
+    assert nano_sync.flush()
+    nano_sync.close()
+    assert nano_server.received == [ 100, 300 ]
+
+
+def test_closing_while_rate_limited_keeps_the_count_queued( enovel, nano_server ):
+    nano_sync = enovel.NaNoSync( min_interval = 60 )
+    nano_sync.submit( 100 )
+    assert nano_sync.flush()
+    nano_sync.submit( 200 )
+    started = time.monotonic()
+    nano_sync.close()
+    assert time.monotonic() - started < 5
+    assert nano_server.received == [ 100 ]
+    assert queued_words( enovel ) == 200
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+
+def baseline_normalize( file_contents, replacements ):
+    # normalize_markdown() as the script has always behaved: replacements
+    # one after another, then strip, then the HR markers, then blank lines
+    for replace_value in replacements:
+        file_contents = file_contents.replace( replace_value, replacements[ replace_value ] )
+    file_contents = file_contents.strip()
+    file_contents = file_contents.replace( "----\n", "" )
+    file_contents = file_contents.replace( "\n----", "" )
+    file_contents = file_contents.replace( "---\n", "" )
+    file_contents = file_contents.replace( "\n---", "" )
+    return file_contents.replace( "\n\n\n", "\n\n" )
+
+
+def normalize( enovel, text, replacements = None ):
+    enovel.config["replacements"] = replacements or {}
+    enovel.compile_normalizer()
+    return enovel.normalize_markdown( text )
+
+
+@pytest.mark.parametrize( "text, replacements, expected", [
+    # a replaced HR is text, not an HR any more
+    ( "Para\n\n----\n\nNext", { "--": "—" }, "Para\n\n——\n\nNext" ),
+    # the strip comes before the HR removal, so indented code keeps its indent
+    ( "----\n    code line", None, "    code line" ),
+    ( "a\n-----\nb", None, "a\n-b" ),
+    # replacements see the output of the ones before them
+    ( "wait......", { "...": "…", "……": "X" }, "waitX" ),
+    ( "  Some text.\n\n\n\nMore.\n---\n", None, "Some text.\n\n\nMore." ),
+] )
+def test_normalize_markdown_keeps_the_original_semantics( enovel, text, replacements, expected ):
+    assert normalize( enovel, text, replacements ) == expected
+    assert normalize( enovel, text, replacements ) == baseline_normalize( text, replacements or {} )
+
+
+def test_replaced_hr_still_counts_as_words( enovel ):
+    assert enovel.count_words( normalize( enovel, "Para\n\n----\n\nNext", { "--": "—" } ) ) == 3
+
+
+def test_normalize_markdown_matches_the_baseline_on_random_text( enovel ):
+    pieces = [ "word", " ", "\n", "\n\n", "-", "--", "---", "----", ".", "...", "……", "—", "  ", "\t", "é" ]
+    replacement_sets = [ {}, { "--": "—", "...": "…" }, { "...": "…", "……": "X" }, { "---": "~" }, { "-\n": "" } ]
+    generator = random.Random( 6 )
+    for attempt in range( 3000 ):
+        text = "".join( generator.choice( pieces ) for piece in range( generator.randint( 0, 30 ) ) )
+        replacements = generator.choice( replacement_sets )
+        assert normalize( enovel, text, replacements ) == baseline_normalize( text, replacements ), ( text, replacements )
@@ -0,0 +1,82 @@
+import shutil
+import subprocess
+
+import pytest
+
+# markdown and what pandoc's plain writer makes of it, read with the same
+# pandoc_markdown_arg as the other exports (smart punctuation on)
+golden_outputs = [
+    ( "# Chapter One", "Chapter One" ),
+    ( "## A *Small* Heading ##\nFollowed by text.", "A Small Heading\n\nFollowed by text." ),
+    ( "Chapter Two\n===========", "Chapter Two" ),
+    ( "It was *dark* and **stormy**, _very_ __very__ stormy.", "It was dark and stormy, very very stormy." ),
+    ( "snake_case_words and _snake_case_words_ stay whole", "snake_case_words and snake_case_words stay whole" ),
+    ( "See [the site](http://example.com), [a reference][ref] and ![a picture](cover.png).", "See the site, a reference and a picture." ),
+    ( "Run `--force *now*` or ``a `tick` ``.", "Run --force *now* or a `tick`." ),
+    ( "Dashes -- and --- and dots... are smartened.", "Dashes \u2013 and \u2014 and dots\u2026 are smartened." ),
+    ( "\"Don't,\" she said, 'please.'", "\u201cDon\u2019t,\u201d she said, \u2018please.\u2019" ),
+    ( "Note[^1] here.\n\n[^1]: The note.", "Note[1] here.\n\n[1] The note." ),
+    ( "One[^b], two^[An *inline* note.] and one again[^b].\n\n[^b]: The first\nnote.", "One[1], two[2] and one again[1].\n\n[1] The first note.\n\n[2] An inline note." ),
+    ( "Text[^long].\n\n[^long]: First paragraph.\n\n    Second paragraph.", "Text[1].\n\n[1] First paragraph.\n\nSecond paragraph." ),
+    ( "Some <em>raw</em> HTML<br/> and <!-- a comment --> gone.", "Some raw HTML and gone." ),
+    ( "<div class=\"aside\">\n\nInside.\n\n</div>", "Inside." ),
+    ( "Roses are red,  \nviolets are blue,\\\nand so on\nand on.", "Roses are red,\nviolets are blue,\nand so on and on." ),
+    ( "    def code():\n        return a -- b", "    def code():\n        return a -- b" ),
+    ( "\\*not emphasis\\* and a \\_literal\\_", "*not emphasis* and a _literal_" ),
+    ( "- one\n- two", "-   one\n-   two" ),
+    ( "* one\n+ two", "-   one\n-   two" ),
+    ( "1. first\n1. second\n1. third", "1.  first\n2.  second\n3.  third" ),
+    ( "3) third\n4) fourth", "3)  third\n4)  fourth" ),
+    ( "- an item long enough to wrap at the margin because it just keeps on going and going",
+        "-   an item long enough to wrap at the margin because it just keeps on\n    going and going" ),
+    ( "> quoted *text*\n> more", "  quoted text more" ),
+    ( "\\newpage", "" ),
+    ( "* * *", "-" * 72 ),
+    ( "----", "-" * 72 ),
+    ( "A line that is long enough to need wrapping at seventy two columns, like pandoc does it.",
+        "A line that is long enough to need wrapping at seventy two columns, like\npandoc does it." ),
+]
+
+
+@pytest.mark.parametrize( "markdown, plain_text", golden_outputs )
+def test_plain_text_matches_pandoc( enovel, markdown, plain_text ):
+    assert "".join( enovel.plain_text_chunks( [ markdown ] ) ) == plain_text + "\n"
+
+
+def test_smart_punctuation_follows_the_pandoc_markdown_arg( enovel, monkeypatch ):
+    monkeypatch.setattr( enovel, "pandoc_markdown_arg", "-f markdown-smart" )
+    assert "".join( enovel.plain_text_chunks( [ "Dashes -- and \"quotes\"..." ] ) ) == "Dashes -- and \"quotes\"...\n"
+
+
+@pytest.mark.skipif( shutil.which( "pandoc" ) is None, reason="pandoc isn't installed" )
+@pytest.mark.parametrize( "markdown, plain_text", golden_outputs )
+def test_golden_outputs_are_pandocs( enovel, markdown, plain_text ):
+    # the arguments the build parses the manuscript with
+    enovel._set_pandoc_args()
+    pandoc_args = [ "pandoc" ] + enovel.pandoc_markdown_arg.split() + [ "-t", "plain", "--columns=72" ]
+    pandoc_output = subprocess.run( pandoc_args, input=markdown + "\n\n[ref]: http://example.com\n", stdout=subprocess.PIPE, universal_newlines=True, check=True ).stdout
+    assert pandoc_output.strip("\n") == plain_text
+
+
+def test_text_export_of_a_chapter( enovel, write_scene ):
+    write_scene( "Chapter 1 - One/00 - Chapter Header.md", "\\newpage\n\n# Chapter One\n\n" )
+    write_scene( "Chapter 1 - One/01 - Scene.md", "It was a *dark* night.\n" )
+    write_scene( "Chapter 1 - One/02 - Scene.md", "Morning came.\n" )
+    enovel.create_txt()
+    with open( enovel.export_file( "txt" ), 'r', encoding="utf8" ) as text_file:
+        # the header is a scene too, so a rule follows it like in the other exports
+        rule = "-" * 72
+        assert text_file.read() == "Chapter One\n\n" + rule + "\n\nIt was a dark night.\n\n" + rule + "\n\nMorning came.\n"
+
+
+def test_failed_text_export_is_not_recorded( enovel, write_scene, monkeypatch, capsys ):
+    write_scene( "Chapter 1/01 - Scene.md", "one\n" )
+
+    def fail_to_write():
+        raise OSError( "disk full" )
+    monkeypatch.setitem( enovel.native_export_writers, "txt", fail_to_write )
+    enovel.create_txt()
+    output = capsys.readouterr().out
+    assert "ERROR: ./Exports/My Ebook.txt failed" in output
+    assert "created" not in output
+    assert "txt" not in enovel.load_build_manifest()
@@ -0,0 +1,53 @@
+import datetime
+import os
+
+
+def test_new_store_imports_progress_tsv( enovel ):
+    os.mkdir( enovel.progress_directory )
+    with open( enovel.progress_directory + "/progress.tsv", 'w', encoding="utf8" ) as tsv_file:
+        tsv_file.write( "2023-11-01\t1200\n2023-11-02\t2500\n\n2023-11-04\t2400\n" )
+
+    progress_store = enovel.ProgressStore( enovel.progress_database_file )
+    try:
+        assert progress_store.daily_totals() == [ ( "2023-11-01", 1200 ), ( "2023-11-02", 2500 ), ( "2023-11-04", 2400 ) ]
+        assert progress_store.daily_totals( "2023-11-02", "2023-11-03" ) == [ ( "2023-11-02", 2500 ) ]
+        assert progress_store.snapshots()[0] == ( "2023-11-01T00:00:00", 1200 )
+    finally:
+        progress_store.close()
+
+    # only a new store imports, a second open doesn't count the days again
+    with open( enovel.progress_directory + "/progress.tsv", 'a', encoding="utf8" ) as tsv_file:
+        tsv_file.write( "2023-11-05\t3000\n" )
+    progress_store = enovel.ProgressStore( enovel.progress_database_file )
+    try:
+        assert len( progress_store.daily_totals() ) == 3
+    finally:
+        progress_store.close()
+
+
+def test_record_logs_changes_and_tracks_each_day( enovel ):
+    os.mkdir( enovel.progress_directory )
+    progress_store = enovel.ProgressStore( enovel.progress_database_file )
+    try:
+        yesterday = datetime.datetime.now() - datetime.timedelta( days = 1 )
+        progress_store.record( 1000, yesterday )
+        assert progress_store.todays_progress() == 0
+
+        progress_store.record( 1200 )
+        progress_store.record( 1200 )
+        progress_store.record( 1150 )
+        # today started from yesterday's last count
+        assert progress_store.todays_progress() == 150
+        # unchanged counts aren't logged again
+        assert [ words for recorded_at, words in progress_store.snapshots() ] == [ 1000, 1200, 1150 ]
+        assert progress_store.daily_totals() == [ ( yesterday.date().isoformat(), 1000 ), ( datetime.date.today().isoformat(), 1150 ) ]
+    finally:
+        progress_store.close()
+
+
+def test_save_progress_exports_the_daily_totals( enovel, write_scene ):
+    write_scene( "Chapter 1/01 - Scene.md", "one two three\n" )
+    enovel.save_progress( dont_draw_graphs = False )
+    assert enovel.todays_progress == 3
+    with open( enovel.progress_directory + "/progress.tsv", 'r', encoding="utf8" ) as tsv_file:
+        assert tsv_file.read() == datetime.date.today().isoformat() + "\t3\n"
@@ -0,0 +1,86 @@
+import os
+import shutil
+
+
+def scene_words( index ):
+    return { file_path: index_entry["words"] for file_path, index_entry in index.scenes.items() }
+
+
+def test_scan_trusts_scenes_whose_stat_is_unchanged( enovel, write_scene ):
+    scene_file = write_scene( "Chapter 1/01 - Scene.md", "one two three\n" )
+    assert enovel.project_index( refresh=True ).word_count() == 3
+    assert os.path.isfile( enovel.project_index_file )
+
+    # same size and mtime, so the saved counts are used without reading it
+    file_stat = os.stat( scene_file )
+    with open( scene_file, 'w', encoding="utf8" ) as content_file:
+        content_file.write( "one two thre\n\n" )
+    os.utime( scene_file, ns=( file_stat.st_atime_ns, file_stat.st_mtime_ns ) )
+    assert enovel.project_index( refresh=True ).word_count() == 3
+
+
+def test_scan_recounts_a_scene_whose_size_changed( enovel, write_scene ):
+    scene_file = write_scene( "Chapter 1/01 - Scene.md", "one two three\n" )
+    file_stat = os.stat( scene_file )
+    assert enovel.project_index( refresh=True ).word_count() == 3
+
+    with open( scene_file, 'w', encoding="utf8" ) as content_file:
+        content_file.write( "one two three four\n" )
+    os.utime( scene_file, ns=( file_stat.st_atime_ns, file_stat.st_mtime_ns ) )
+    assert enovel.project_index( refresh=True ).word_count() == 4
+
+
+def test_new_replacements_invalidate_the_saved_index( enovel, write_scene ):
+    write_scene( "Chapter 1/01 - Scene.md", "one two TK three\n" )
+    assert enovel.project_index( refresh=True ).word_count() == 4
+
+    enovel.config["replacements"] = { "TK": "" }
+    enovel.compile_normalizer()
+    assert enovel.project_index( refresh=True ).word_count() == 3
+
+
+def test_scan_counts_like_the_text_path_in_low_memory_mode( enovel, write_scene ):
+    write_scene( "Chapter 1/01 - Scene.md", "  one two\n\n\n\nthree  \n" )
+    write_scene( "Chapter 1/02 - Scene.md", "four\n\n---\n\nfive\r\n" )
+    text_index = enovel.ProjectIndex().scan()
+    os.remove( enovel.project_index_file )
+
+    enovel.config["lowMemory"] = True
+    mapped_index = enovel.ProjectIndex().scan()
+    assert mapped_index.scenes == text_index.scenes
+
+
+def test_directory_events_update_the_index( enovel, write_scene, tmp_path ):
+    write_scene( "Chapter 1/01 - Scene.md", "one two\n" )
+    index = enovel.project_index( refresh=True )
+    chapter_one = os.path.join( enovel.manuscript_dir, "Chapter 1" )
+
+    # a directory created with scenes already in it (e.g. copied in)
+    write_scene( "Chapter 2/01 - Scene.md", "three four five\n" )
+    chapter_two = os.path.join( enovel.manuscript_dir, "Chapter 2" )
+    index.apply_event( "created", True, chapter_two, "" )
+    assert scene_words( index ) == {
+        os.path.join( chapter_one, "01 - Scene.md" ): 2,
+        os.path.join( chapter_two, "01 - Scene.md" ): 3,
+    }
+
+    # moved in from outside the manuscript, which leaves no source path
+    outside = tmp_path / "Drafts" / "Chapter 3"
+    outside.mkdir( parents=True )
+    ( outside / "01 - Scene.md" ).write_text( "six\n", encoding="utf8" )
+    chapter_three = os.path.join( enovel.manuscript_dir, "Chapter 3" )
+    shutil.move( str( outside ), chapter_three )
+    index.apply_event( "moved", True, "", chapter_three )
+    assert scene_words( index )[ os.path.join( chapter_three, "01 - Scene.md" ) ] == 1
+
+    # renamed inside the manuscript
+    chapter_renamed = os.path.join( enovel.manuscript_dir, "Chapter 2 - Renamed" )
+    os.rename( chapter_two, chapter_renamed )
+    index.apply_event( "moved", True, chapter_two, chapter_renamed )
+    assert os.path.join( chapter_two, "01 - Scene.md" ) not in index.scenes
+    assert scene_words( index )[ os.path.join( chapter_renamed, "01 - Scene.md" ) ] == 3
+
+    # moved out of the manuscript
+    shutil.move( chapter_three, str( outside ) )
+    index.apply_event( "moved", True, chapter_three, "" )
+    assert index.word_count() == 5
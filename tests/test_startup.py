@@ -0,0 +1,21 @@
+import json
+import subprocess
+import sys
+
+from conftest import script_file
+
+# starts the script without a command (it prints its help) and reports
+# which modules it imported
+startup_code = """
+import json, runpy, sys
+sys.argv = [ sys.argv[1] ]
+runpy.run_path( sys.argv[0], run_name="__main__" )
+print( json.dumps( sorted( sys.modules ) ) )
+"""
+
+
+def test_startup_imports_no_optional_packages( enovel, tmp_path ):
+    startup = subprocess.run( [ sys.executable, "-c", startup_code, script_file ], cwd=str( tmp_path ), stdout=subprocess.PIPE, universal_newlines=True, check=True )
+    imported_modules = json.loads( startup.stdout.strip().splitlines()[-1] )
+    guarded_imports = [ module_name for module_name in imported_modules if module_name.split(".")[0] in enovel.startup_guarded_modules ]
+    assert guarded_imports == []
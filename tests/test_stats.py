@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+import os
+
+
+def saved_book( enovel, write_scene ):
+    write_scene( "Chapter 1/01 - Scene.md", "one two three\n\nfour\n" )
+    write_scene( "Chapter 1/02 - Scene.md", "five six\n" )
+    write_scene( "Chapter 2/01 - Scene.md", "seven eight nine\n" )
+    enovel.save_progress( dont_draw_graphs = True )
+
+
+def test_changed_counts_since_the_last_save( enovel, write_scene ):
+    saved_book( enovel, write_scene )
+    write_scene( "Chapter 1/01 - Scene.md", "one two three\n\nfour five six\n" )
+    write_scene( "Chapter 1/03 - Scene.md", "ten\n" )
+    os.remove( "Manuscript/Chapter 1/02 - Scene.md" )
+    os.remove( "Manuscript/Chapter 2/01 - Scene.md" )
+    os.rmdir( "Manuscript/Chapter 2" )
+    enovel.project_index( refresh = True )
+
+    manuscript_stats = enovel.project_stats()
+    chapter = manuscript_stats["chapters"][0]
+    assert [ ( scene["scene"], scene["words"], scene["changed"] ) for scene in chapter["scenes"] ] == [
+        ( "01 - Scene.md", 6, 2 ),
+        ( "03 - Scene.md", 1, 1 ),
+    ]
+    assert ( chapter["words"], chapter["paragraphs"], chapter["changed"] ) == ( 7, 3, 3 - 2 )
+    # the deleted chapter's words only count against the total, once
+    assert ( manuscript_stats["words"], manuscript_stats["changed"] ) == ( 7, 1 - 3 )
+    assert manuscript_stats["characters"] == len( "one two three\n\nfour five six" ) + len( "ten" )
+
+
+def test_stats_as_json_and_csv( enovel, write_scene, capsys ):
+    saved_book( enovel, write_scene )
+    write_scene( "Chapter 2/01 - Scene.md", "seven eight nine ten\n" )
+    enovel.project_index( refresh = True )
+    enovel.config["wordCountOffset"] = 2
+
+    enovel.command_options["output_format"] = "json"
+    enovel.stats()
+    manuscript_stats = json.loads( capsys.readouterr().out )
+    assert ( manuscript_stats["words"], manuscript_stats["project_words"], manuscript_stats["changed"] ) == ( 10, 8, 1 )
+    assert [ chapter["chapter"] for chapter in manuscript_stats["chapters"] ] == [ "Chapter 1", "Chapter 2" ]
+
+    enovel.command_options["output_format"] = "csv"
+    enovel.stats()
+    rows = list( csv.reader( io.StringIO( capsys.readouterr().out ) ) )
+    assert rows[0] == [ "level", "chapter", "scene", "words", "characters", "paragraphs", "changed" ]
+    assert [ row[:4] + row[6:] for row in rows[1:] ] == [
+        [ "scene", "Chapter 1", "01 - Scene.md", "4", "0" ],
+        [ "scene", "Chapter 1", "02 - Scene.md", "2", "0" ],
+        [ "chapter", "Chapter 1", "", "6", "0" ],
+        [ "scene", "Chapter 2", "01 - Scene.md", "4", "1" ],
+        [ "chapter", "Chapter 2", "", "4", "1" ],
+        [ "total", "", "", "10", "1" ],
+    ]
+
+
+def test_stats_table( enovel, write_scene, capsys ):
+    saved_book( enovel, write_scene )
+    enovel.stats()
+    output = capsys.readouterr().out
+    assert "  Manuscript" in output
+    assert "(changed is since the last save, the project word count is 9)" in output
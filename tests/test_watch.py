@@ -0,0 +1,52 @@
+import threading
+import time
+
+
+def test_stopping_watch_waits_for_the_build( enovel, write_scene, converters, monkeypatch ):
+    write_scene( "Chapter 1/01 - Scene.md", "one two three\n" )
+    enovel.command_options["build"] = [ "txt", "html" ]
+    real_sleep = time.sleep
+
+    def interrupt( seconds ):
+        # Control-C as soon as the watcher is running
+        if threading.current_thread() is threading.main_thread():
+            raise KeyboardInterrupt()
+        real_sleep( seconds )
+    monkeypatch.setattr( time, "sleep", interrupt )
+
+    enovel.watch()
+    assert not any( thread.name == "watch-build" and thread.is_alive() for thread in threading.enumerate() )
+    assert enovel.command_options["incremental"] == False
+
+
+def test_a_burst_of_saves_is_recounted_once( enovel, write_scene, monkeypatch ):
+    write_scene( "Chapter 1/01 - Scene.md", "one\n" )
+    monkeypatch.setattr( enovel, "watch_debounce_seconds", 0.3 )
+    recounts = []
+    real_save_progress = enovel.save_progress
+
+    def recorded_save_progress( *arguments ):
+        if arguments:
+            # watch's recount, with the new total
+            recounts.append( arguments[1] )
+        return real_save_progress( *arguments )
+    monkeypatch.setattr( enovel, "save_progress", recorded_save_progress )
+    real_sleep = time.sleep
+
+    def edit_then_interrupt( seconds ):
+        if threading.current_thread() is not threading.main_thread():
+            return real_sleep( seconds )
+        # an editor saving the scene several times in quick succession
+        for text in ( "one two\n", "one two three\n", "one two three four\n" ):
+            write_scene( "Chapter 1/01 - Scene.md", text )
+            real_sleep( 0.05 )
+        deadline = time.monotonic() + 10
+        while not recounts and time.monotonic() < deadline:
+            real_sleep( 0.05 )
+        # long enough for a second recount to show up
+        real_sleep( 1 )
+        raise KeyboardInterrupt()
+    monkeypatch.setattr( time, "sleep", edit_then_interrupt )
+
+    enovel.watch()
+    assert recounts == [ 4 ]
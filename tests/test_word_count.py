@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+texts = [
+    "",
+    " ",
+    "one",
+    "one two  three\n\nfour\tfive",
+    "non\u00a0breaking\u00a0spaces",
+    "line\u2028separator and\u2029paragraph",
+    "ideographic\u3000space\u3000日本語\u3000テキスト",
+    "file\x1cgroup\x1drecord\x1eunit\x1fseparators",
+    "next\x85line and\x0bvertical\x0cfeed",
+    "ünïcödé wörds ñ 😀 emoji😀joined",
+    "   leading and trailing   ",
+]
+
+
+def file_words( tmp_path, text ):
+    scene_file = tmp_path / "scene.md"
+    scene_file.write_bytes( text.encode( "utf8" ) )
+    return scene_file
+
+
+@pytest.mark.parametrize( "text", texts )
+@pytest.mark.parametrize( "window", [ 1, 2, 3, 5, 7, 1 << 16 ] )
+def test_count_words_is_split( enovel, tmp_path, monkeypatch, text, window ):
+    # small windows put the window edges mid-word and mid-character
+    monkeypatch.setattr( enovel, "word_count_window", window )
+    assert enovel.count_words( text ) == len( text.split() )
+    assert enovel.count_words( text.encode( "utf8" ) ) == len( text.split() )
+    assert enovel.count_file_words( str( file_words( tmp_path, text ) ) ) == len( text.split() )
+
+
+def test_count_words_on_random_text( enovel, tmp_path, monkeypatch ):
+    pieces = [ "a", "word", "é", "日本", "😀", " ", "  ", "\n", "\t", "\u00a0", "\u2028", "\u3000", "\x1c", "\x1f", "\x85" ]
+    generator = random.Random( 7 )
+    for attempt in range( 2000 ):
+        monkeypatch.setattr( enovel, "word_count_window", generator.choice( [ 1, 2, 3, 4, 6, 9, 16 ] ) )
+        text = "".join( generator.choice( pieces ) for piece in range( generator.randint( 0, 40 ) ) )
+        assert enovel.count_words( text ) == len( text.split() ), repr( text )
+        assert enovel._count_utf8_words( text.encode( "utf8" ) ) == len( text.split() ), repr( text )
+
+
+def test_count_file_words_of_an_empty_file( enovel, tmp_path ):
+    assert enovel.count_file_words( str( file_words( tmp_path, "" ) ) ) == 0